@@ -1,7 +1,60 @@
-from flask import Flask
+import os
+import time
 
-app = Flask(__name__)
 
-from . import calc_shell
-app.config.from_mapping( SECRET_KEY=b'_\x91\x06U\x93\x06V9Ej\xe4\xb9\xbd\x13]\x03',)
-app.register_blueprint(calc_shell.bp)
+"""
+the Flask app is built by create_app(); importing the package only pulls in the
+numeric modules, and Flask, scipy and astropy are imported when first needed.
+neid_calculator.app is still available and is created on first access.
+
+to share the warmed-up grids copy-on-write between gunicorn workers, build the
+app in the master process before it forks:
+
+    gunicorn --preload 'neid_calculator:create_app()'
+"""
+
+def create_app(config=None, warm=True):
+    """
+    build the calculator Flask app
+    config:        mapping of extra Flask config values
+    warm:          load the grids and build the interpolators before returning
+
+    the SECRET_KEY is read from config or the NEID_SECRET_KEY environment
+    variable; without either a random key is generated (with a warning unless
+    TESTING), so sessions do not outlive the process. the time spent is logged and kept in app.config['STARTUP_TIMES'] (seconds)
+    """
+    times = {}
+    start = time.perf_counter()
+    from flask import Flask
+    from . import calc_shell
+    times['import'] = time.perf_counter()-start
+
+    app = Flask(__name__)
+    app.config.from_mapping(SECRET_KEY=os.environ.get('NEID_SECRET_KEY'))
+    if config:
+        app.config.from_mapping(config)
+    if not app.config['SECRET_KEY']:
+        # generated before gunicorn --preload forks, so the workers share it
+        app.config['SECRET_KEY'] = os.urandom(16)
+        if not app.config.get('TESTING'):
+            app.logger.warning('NEID_SECRET_KEY is not set; using a random session key')
+    app.register_blueprint(calc_shell.bp)
+
+    if warm:
+        warm_start = time.perf_counter()
+        from . import neid_etcalc_public
+        neid_etcalc_public.warm_up()
+        times['warm_up'] = time.perf_counter()-warm_start
+    times['total'] = time.perf_counter()-start
+    app.config['STARTUP_TIMES'] = times
+    app.logger.info('calculator app ready in %.3f s (%s)', times['total'],
+                    ', '.join('%s %.3f s' % item for item in times.items() if item[0]!='total'))
+    return app
+
+
+def __getattr__(name):
+    if name=='app':
+        global app
+        app = create_app(warm=False)
+        return app
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,154 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+accuracy regression harness for the calculator functions
+
+the public functions are evaluated on a fixed grid of (teff, vmag, exptime,
+wavelength, target) points and compared with the frozen values in
+accuracy_reference.json, so a speed-up that changes the physics is caught.
+
+    python -m neid_calculator.accuracy check
+    python -m neid_calculator.accuracy freeze    (only when a change is intended)
+"""
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'accuracy_reference.json')
+
+TEFF = [2700., 3350., 4420., 5500., 6600.]
+VMAG = [3., 6.3, 8., 11.7, 17.]
+EXPTIME = [10., 60., 300., 1234., 3600.]
+WAVELENGTH = [383.62046651, 552.96643821, 929.98900971]
+ORDER = [160, 110, 66]
+# order centers, points between two orders and points off the ends
+MATCH_WAVELENGTH = WAVELENGTH+[553.5, 553.25, 300., 1100.]
+PROFILE_EXPTIME = [1234.]
+SNR = [10., 100., 400.]
+RV_PRECISION = [0.3, 1., 5.]
+
+# relative tolerance for interpolated values, absolute tolerance (s) for solved
+# exposure times; the 2 s steps must match exactly
+RTOL = 1e-9
+EXPTIME_ATOL = 1e-2
+
+
+def _points(*axes):
+    return [np.array(column) for column in zip(*itertools.product(*axes))]
+
+
+def _order_profile(key):
+    def profile(teff, vmag, exptime):
+        return etc.NEID_order_profile(teff, vmag, exptime)[key]
+    return profile
+
+
+def _order_match(wavelength):
+    return np.stack(etc.NEID_order_match(wavelength))
+
+
+def cases():
+    """
+    name, function and inputs of every case in the reference set
+    """
+    return [
+        ('NEID_RV_prec', etc.NEID_RV_prec, _points(TEFF, VMAG, EXPTIME), {}),
+        ('NEID_RV_prec_order', etc.NEID_RV_prec, _points(TEFF, VMAG, EXPTIME, ORDER)[:3],
+         {'use_order': True, 'order': _points(TEFF, VMAG, EXPTIME, ORDER)[3]}),
+        ('NEID_SNR', etc.NEID_SNR, _points(TEFF, VMAG, EXPTIME, WAVELENGTH), {}),
+        ('NEID_exptime_RV', etc.NEID_exptime_RV, _points(TEFF, VMAG, RV_PRECISION), {}),
+        ('NEID_exptime_RV_quantized', etc.NEID_exptime_RV, _points(TEFF, VMAG, RV_PRECISION),
+         {'quantize': True}),
+        ('NEID_exptime_SNR', etc.NEID_exptime_SNR, _points(TEFF, VMAG, SNR, WAVELENGTH), {}),
+        ('NEID_exptime_SNR_quantized', etc.NEID_exptime_SNR, _points(TEFF, VMAG, SNR, WAVELENGTH),
+         {'quantize': True}),
+        ('NEID_max_exptime', etc.NEID_max_exptime, _points(TEFF, VMAG), {}),
+        # every order of every target, as the SNR page and /api/profile use it
+        ('NEID_order_profile_snr', _order_profile('snr'), _points(TEFF, VMAG, PROFILE_EXPTIME), {}),
+        ('NEID_order_profile_rv_precision', _order_profile('rv_precision'),
+         _points(TEFF, VMAG, PROFILE_EXPTIME), {}),
+        ('NEID_order_match', _order_match, [np.array(MATCH_WAVELENGTH)], {}),
+    ]
+
+
+def evaluate():
+    results = {}
+    for name, func, args, kwargs in cases():
+        results[name] = {'inputs': [a.tolist() for a in args],
+                         'values': np.asarray(func(*args, **kwargs), dtype=np.double).tolist()}
+    return results
+
+
+def freeze(path=REFERENCE_FILE):
+    """
+    write the current outputs as the new reference values
+    """
+    cases = evaluate()
+    with open(path, 'w') as f:
+        # one case per line keeps diffs of the reference readable
+        f.write('{"grid_checksum": %s,\n "cases": {\n' % json.dumps(grid_store.get_store().checksum()))
+        f.write(',\n'.join('  %s: %s' % (json.dumps(name), json.dumps(cases[name]))
+                           for name in sorted(cases)))
+        f.write('\n}}\n')
+    return path
+
+
+def check(path=REFERENCE_FILE, rtol=RTOL, exptime_atol=EXPTIME_ATOL):
+    """
+    compare the current outputs with the reference values
+    returns a dict with the number of points, the number of failures and the
+    largest deviation for every case
+    """
+    with open(path) as f:
+        reference = json.load(f)
+    if reference['grid_checksum']!=grid_store.get_store().checksum():
+        print('warning: the reference values were frozen from different grids')
+    reference = reference['cases']
+    report = {}
+    for name, func, args, kwargs in cases():
+        expected = np.array(reference[name]['values'], dtype=np.double)
+        actual = np.asarray(func(*args, **kwargs), dtype=np.double)
+        if name.endswith('_quantized') or name in ('NEID_max_exptime', 'NEID_order_match'):
+            close = actual==expected
+        elif name.startswith('NEID_exptime'):
+            close = np.abs(actual-expected)<=exptime_atol
+        else:
+            close = np.abs(actual-expected)<=rtol*np.abs(expected)
+        close |= np.isnan(actual) & np.isnan(expected)
+        with np.errstate(invalid='ignore'):
+            deviation = np.abs(actual-expected)
+        report[name] = {'points': int(expected.size), 'failures': int(np.count_nonzero(~close)),
+                        'max_deviation': float(np.nanmax(deviation)) if np.any(~np.isnan(deviation)) else 0.}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.accuracy',
+                                     description='check the calculator against frozen reference values')
+    parser.add_argument('command', choices=('check', 'freeze'))
+    parser.add_argument('--reference', default=REFERENCE_FILE)
+    parser.add_argument('--rtol', type=float, default=RTOL)
+    parser.add_argument('--exptime-atol', type=float, default=EXPTIME_ATOL)
+    args = parser.parse_args(argv)
+
+    if args.command=='freeze':
+        print('reference values written to %s' % freeze(args.reference))
+        return 0
+    report = check(args.reference, rtol=args.rtol, exptime_atol=args.exptime_atol)
+    for name, stats in report.items():
+        print('%-32s %4d points  %3d failures  max deviation %.3g'
+              % (name, stats['points'], stats['failures'], stats['max_deviation']))
+    failed = sum(stats['failures'] for stats in report.values())
+    print('FAILED' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+exposure time allocation for a night or a semester
+
+an Allocator holds a target list (teff, vmag, RV precision goal, priority) and,
+per target, the curves the plan is made from:
+
+    max_exptime      longest exposure before the peak order saturates
+                     (NEID_max_exptime); longer visits are split into several
+                     exposures of at most this length
+    goal visit       fewest exposures, and their length, that reach the RV goal;
+                     n exposures of precision s combine to s/sqrt(n)
+    precision curve  RV precision reached with each of a fixed log-spaced set of
+                     total times, split the same way
+
+plan() then shares out a time budget, either to meet as many (priority
+weighted) goals as possible, or to minimize the priority weighted sum of the
+squared RV precisions of all targets. everything is evaluated with the
+vectorized calculator functions, so 10^4 targets take a few seconds to set up.
+update() changes one target and recomputes only its curves, so re-planning
+after a change only repeats the (fast) allocation.
+
+    allocation = Allocator(teff, vmag, rv_goal, priority).plan(8*3600)
+"""
+
+MAX_EXPOSURES = 16
+N_TOTALS = 160
+OBJECTIVES = ('goals', 'error')
+
+
+class Allocator(object):
+    """
+    teff:            Effective Temperature (K) of each target
+    vmag:            V-band magnitude
+    rv_goal:         Desired Radial Velocity Precision (m/s)
+    priority:        weight of each target (higher is more important)
+    overhead:        time (s) added to every exposure (readout, acquisition)
+    max_exposures:   most exposures a target may be split into
+    n_totals:        number of total times in the precision curves
+    """
+
+    def __init__(self, teff, vmag, rv_goal, priority=1., overhead=0., max_exposures=MAX_EXPOSURES,
+                 n_totals=N_TOTALS):
+        self.teff, self.vmag, self.rv_goal, self.priority = [
+            np.array(a, dtype=np.double) for a in np.broadcast_arrays(teff, vmag, rv_goal, priority)]
+        if self.teff.ndim!=1:
+            raise ValueError('expected one-dimensional target lists')
+        n = len(self.teff)
+        self.overhead = overhead
+        self.max_exposures = max_exposures
+        grids = grid_store.get_store()
+        self.totals = np.geomspace(grids.exptime_grid[0], max_exposures*grids.exptime_grid[-1], n_totals)
+
+        self.max_exptime = np.empty(n)
+        self.goal_exposures = np.empty(n, dtype=int)
+        self.goal_exptime = np.empty(n)
+        self.curve_exposures = np.empty((n, n_totals), dtype=int)
+        self.curve_precision = np.empty((n, n_totals))
+        self._compute(np.arange(n))
+
+    def _compute(self, rows):
+        """
+        (re)build the cached curves of the given targets
+        """
+        teff = self.teff[rows, np.newaxis]
+        vmag = self.vmag[rows, np.newaxis]
+        max_exptime = etc.NEID_max_exptime(self.teff[rows], self.vmag[rows])
+        self.max_exptime[rows] = max_exptime
+
+        # goal visit: the fewest exposures that each stay below saturation
+        splits = np.arange(1, self.max_exposures+1)
+        with np.errstate(invalid='ignore'):
+            exptime = etc.NEID_exptime_RV(teff, vmag, self.rv_goal[rows, np.newaxis]*np.sqrt(splits))
+            fits = exptime<=max_exptime[:, np.newaxis]
+        first = np.argmax(fits, axis=1)
+        found = fits[np.arange(len(rows)), first]
+        self.goal_exposures[rows] = np.where(found, first+1, 0)
+        self.goal_exptime[rows] = np.where(found, np.ceil(exptime[np.arange(len(rows)), first]), np.nan)
+
+        # precision curve over the total times, each split into equal exposures
+        with np.errstate(invalid='ignore'):
+            exposures = np.ceil(self.totals/max_exptime[:, np.newaxis])
+        exposures[~(exposures<=self.max_exposures)] = 0
+        single = etc.NEID_RV_prec(teff, vmag, self.totals/np.maximum(exposures, 1))
+        self.curve_exposures[rows] = exposures
+        self.curve_precision[rows] = np.where(exposures>0, single/np.sqrt(np.maximum(exposures, 1)), np.nan)
+
+    def update(self, index, teff=None, vmag=None, rv_goal=None, priority=None):
+        """
+        change the parameters of one target; only its curves are recomputed
+        """
+        for name, value in (('teff', teff), ('vmag', vmag), ('rv_goal', rv_goal), ('priority', priority)):
+            if value is not None:
+                getattr(self, name)[index] = value
+        if teff is not None or vmag is not None or rv_goal is not None:
+            self._compute(np.atleast_1d(index))
+
+    def goal_time(self):
+        """
+        time (s, with overheads) needed to reach each target's RV goal; inf if it
+        cannot be reached within max_exposures exposures
+        """
+        return np.where(self.goal_exposures>0,
+                        self.goal_exposures*(self.goal_exptime+self.overhead), np.inf)
+
+    def _plan_goals(self, budget):
+        cost = self.goal_time()
+        exposures = np.zeros(len(cost), dtype=int)
+        exptime = np.zeros(len(cost))
+        with np.errstate(divide='ignore'):
+            value = np.where(np.isfinite(cost) & (self.priority>0), self.priority/cost, -np.inf)
+        left = budget
+        # greedy knapsack: best priority per second first, skipping what no longer fits
+        for i in np.argsort(-value, kind='stable'):
+            if value[i]==-np.inf:
+                break
+            if cost[i]<=left:
+                left -= cost[i]
+                exposures[i] = self.goal_exposures[i]
+                exptime[i] = self.goal_exptime[i]
+        with np.errstate(invalid='ignore'):
+            precision = etc.NEID_RV_prec(self.teff, self.vmag, np.where(exposures>0, exptime, np.nan))
+        return exposures, exptime, precision/np.sqrt(np.maximum(exposures, 1))
+
+    def _plan_error(self, budget, iterations=80):
+        rows = np.arange(len(self.teff))
+        observable = np.any(np.isfinite(self.curve_precision), axis=1)
+        cost = self.totals+self.curve_exposures*self.overhead
+        with np.errstate(invalid='ignore'):
+            error = np.where(np.isfinite(self.curve_precision),
+                             self.priority[:, np.newaxis]*self.curve_precision**2, np.inf)
+        error = error[observable]
+        cost = cost[observable]
+
+        def choose(log_lam):
+            choice = np.argmin(error+10.**log_lam*cost, axis=1)
+            return choice, cost[np.arange(len(choice)), choice].sum()
+
+        choice, used = choose(np.inf)
+        if used>budget:
+            raise ValueError('a budget of %g s cannot fit the shortest visit of every observable target '
+                             '(%g s); use objective="goals"' % (budget, used))
+        # the time used falls as the price of time rises; bisect for the lowest
+        # price that fits the budget
+        lo, hi = -30., 30.
+        for _ in range(iterations):
+            mid = 0.5*(lo+hi)
+            if choose(mid)[1]>budget:
+                lo = mid
+            else:
+                hi = mid
+        choice = choose(hi)[0]
+
+        exposures = np.zeros(len(rows), dtype=int)
+        exptime = np.zeros(len(rows))
+        precision = np.full(len(rows), np.nan)
+        picked = rows[observable]
+        exposures[picked] = self.curve_exposures[picked, choice]
+        exptime[picked] = self.totals[choice]/exposures[picked]
+        precision[picked] = self.curve_precision[picked, choice]
+        return exposures, exptime, precision
+
+    def plan(self, budget, objective='goals'):
+        """
+        share out a time budget (s) between the targets
+        objective:     'goals' meets as many goals as possible, best priority per
+                       second first; 'error' observes every target and minimizes
+                       sum(priority * rv_precision**2)
+
+        returns a dict of per-target arrays: n_exposures, exptime (s per
+        exposure), time (s, with overheads), rv_precision (m/s, NaN when not
+        observed) and goal_met, plus the totals used (s), goals_met and
+        weighted_error
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError('objective must be one of %s' % ', '.join(OBJECTIVES))
+        if objective=='goals':
+            exposures, exptime, precision = self._plan_goals(budget)
+        else:
+            exposures, exptime, precision = self._plan_error(budget)
+        precision = np.where(exposures>0, precision, np.nan)
+        time = exposures*(exptime+self.overhead)
+        goal_met = precision<=self.rv_goal
+        observed = exposures>0
+        return {'n_exposures': exposures, 'exptime': exptime, 'time': time, 'rv_precision': precision,
+                'goal_met': goal_met, 'used': float(time.sum()), 'goals_met': int(goal_met.sum()),
+                'weighted_error': float(np.sum(self.priority[observed]*precision[observed]**2))}
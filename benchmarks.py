@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+benchmarks for the calculator functions and the calc_shell routes
+
+    python -m neid_calculator.benchmarks --output bench.json
+    python -m neid_calculator.benchmarks compare old.json new.json
+
+every public function of neid_etcalc_public is timed cold (right after the grid
+store is reloaded, so the time includes loading the grids and building the
+interpolators) and warm, for a scalar call and for batches of targets. the
+calc_shell routes are timed through Flask's test client. the results are written
+as JSON together with the commit and library versions, and compare prints the
+ratio of the warm timings of two result files.
+"""
+
+BATCH_SIZES = (1, 100, 10000)
+SEED = 0
+
+
+def _targets(n):
+    rng = np.random.default_rng(SEED)
+    grids = grid_store.get_store()
+    return {'teff': rng.uniform(grids.teff_grid[0], grids.teff_grid[-1], n),
+            'vmag': rng.uniform(grids.vmag_grid[0], grids.vmag_grid[-1], n),
+            'exptime': 10**rng.uniform(grids.logexp[0], grids.logexp[-1], n),
+            'wavelength': rng.choice(np.asarray(grids.wavelength_grid), n),
+            'snr': 10**rng.uniform(1, 2.7, n),
+            'rv_precision': 10**rng.uniform(-0.5, 1, n)}
+
+
+def functions():
+    """
+    name and call of every benchmarked function for a dict of target arrays
+    """
+    return [
+        ('NEID_RV_prec', lambda t: etc.NEID_RV_prec(t['teff'], t['vmag'], t['exptime'])),
+        ('NEID_SNR', lambda t: etc.NEID_SNR(t['teff'], t['vmag'], t['exptime'], t['wavelength'])),
+        ('NEID_exptime_RV', lambda t: etc.NEID_exptime_RV(t['teff'], t['vmag'], t['rv_precision'])),
+        ('NEID_exptime_SNR', lambda t: etc.NEID_exptime_SNR(t['teff'], t['vmag'], t['snr'], t['wavelength'])),
+        ('NEID_max_exptime', lambda t: etc.NEID_max_exptime(t['teff'], t['vmag'])),
+        ('NEID_order_profile', lambda t: etc.NEID_order_profile(t['teff'], t['vmag'], t['exptime'])),
+        ('NEID_order_match', lambda t: etc.NEID_order_match(t['wavelength'])),
+    ]
+
+
+def _scalar(targets):
+    return {key: values[0] for key, values in targets.items()}
+
+
+def _repeat(call, min_time=0.2, max_calls=1000):
+    times = []
+    start = time.perf_counter()
+    while len(times)<max_calls and (time.perf_counter()-start<min_time or len(times)<3):
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter()-t0)
+    return times
+
+
+def bench_functions(batch_sizes=BATCH_SIZES, min_time=0.2):
+    results = []
+    for name, call in functions():
+        # scalar calls print out of range messages; keep them out of the report
+        def func(targets, call=call):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return call(targets)
+        for n in batch_sizes:
+            targets = _targets(n)
+            if n==1:
+                targets = _scalar(targets)
+            grid_store.reload()
+            t0 = time.perf_counter()
+            func(targets)
+            cold = time.perf_counter()-t0
+            warm = _repeat(lambda: func(targets), min_time)
+            results.append({'name': name, 'batch': n, 'cold_s': cold,
+                            'warm_s': float(np.median(warm)), 'warm_min_s': float(np.min(warm)),
+                            'calls': len(warm), 'per_target_s': float(np.median(warm))/n})
+    return results
+
+
+def _test_app():
+    from jinja2 import ChoiceLoader, DictLoader
+
+    import neid_calculator
+    app = neid_calculator.create_app({'TESTING': True, 'CALC_CACHE_SIZE': 0})
+    # the page templates are not part of this package; stand-ins keep the
+    # timings about the calculator rather than about a missing template
+    stub = '{% for m in get_flashed_messages() %}{{ m }}{% endfor %}'
+    app.jinja_loader = ChoiceLoader([app.jinja_loader, DictLoader(
+        {'calc_shell/%s.html' % page: stub for page in
+         ('calculate_rv', 'calculate_snr', 'calculate_exp_rv', 'calculate_exp_snr', 'about')})])
+    return app
+
+
+def routes(batch=1000):
+    """
+    name, path and request arguments of every benchmarked route
+    """
+    targets = _targets(batch)
+    form = {'temperature': '5500', 'vmag': '8', 'exptime': '300', 'wavelength': '552.97',
+            'rvprec': '1', 'snr': '100'}
+
+    def batch_body(fields):
+        return [{field: float(targets[key][i]) for field, key in fields.items()} for i in range(batch)]
+    return [
+        ('calculate_rv', '/calc_shell/calculate_rv', {'data': form}),
+        ('calculate_snr', '/calc_shell/calculate_snr', {'data': form}),
+        ('calculate_exp_rv', '/calc_shell/calculate_exp_rv', {'data': form}),
+        ('calculate_exp_snr', '/calc_shell/calculate_exp_snr', {'data': form}),
+        ('api_rv[%d]' % batch, '/calc_shell/api/rv',
+         {'json': batch_body({'temperature': 'teff', 'vmag': 'vmag', 'exptime': 'exptime'})}),
+        ('api_snr[%d]' % batch, '/calc_shell/api/snr',
+         {'json': batch_body({'temperature': 'teff', 'vmag': 'vmag', 'exptime': 'exptime',
+                              'wavelength': 'wavelength'})}),
+        ('api_exp_rv[%d]' % batch, '/calc_shell/api/exp_rv',
+         {'json': batch_body({'temperature': 'teff', 'vmag': 'vmag', 'rvprec': 'rv_precision'})}),
+        ('api_exp_snr[%d]' % batch, '/calc_shell/api/exp_snr',
+         {'json': batch_body({'temperature': 'teff', 'vmag': 'vmag', 'snr': 'snr',
+                              'wavelength': 'wavelength'})}),
+    ]
+
+
+def bench_routes(min_time=0.5):
+    client = _test_app().test_client()
+    results = []
+    for name, path, kwargs in routes():
+        status = client.post(path, **kwargs).status_code
+        times = _repeat(lambda: client.post(path, **kwargs), min_time)
+        results.append({'name': name, 'path': path, 'status': status, 'requests': len(times),
+                        'latency_s': float(np.median(times)),
+                        'requests_per_s': len(times)/float(np.sum(times))})
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(batch_sizes=BATCH_SIZES, include_routes=True, min_time=0.2):
+    import scipy
+
+    results = {'meta': {'commit': _commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'python': platform.python_version(), 'numpy': np.__version__,
+                        'scipy': scipy.__version__, 'machine': platform.machine(),
+                        'processor': platform.processor()},
+               'functions': bench_functions(batch_sizes, min_time)}
+    if include_routes:
+        results['routes'] = bench_routes()
+    return results
+
+
+def compare(old, new):
+    """
+    ratios new/old of the warm timings in two result files
+    """
+    rows = []
+    for section, key, label in (('functions', 'warm_s', lambda r: '%s[%d]' % (r['name'], r['batch'])),
+                                ('routes', 'latency_s', lambda r: r['name'])):
+        before = {label(r): r[key] for r in old.get(section, [])}
+        for r in new.get(section, []):
+            if label(r) in before:
+                rows.append((label(r), before[label(r)], r[key], r[key]/before[label(r)]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.benchmarks',
+                                     description='time the calculator functions and routes')
+    parser.add_argument('command', nargs='?', default='run', choices=('run', 'compare'))
+    parser.add_argument('files', nargs='*', help='two result files for compare')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--batch', type=int, nargs='+', default=list(BATCH_SIZES), help='batch sizes')
+    parser.add_argument('--no-routes', action='store_true', help='skip the calc_shell routes')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds spent per warm timing')
+    args = parser.parse_args(argv)
+
+    if args.command=='compare':
+        if len(args.files)!=2:
+            parser.error('compare needs two result files')
+        with open(args.files[0]) as f:
+            old = json.load(f)
+        with open(args.files[1]) as f:
+            new = json.load(f)
+        for label, before, after, ratio in compare(old, new):
+            print('%-28s %10.3g s -> %10.3g s  x%.2f' % (label, before, after, ratio))
+        return
+
+    results = run(args.batch, not args.no_routes, args.min_time)
+    for r in results['functions']:
+        print('%-18s batch %7d  cold %8.4f s  warm %10.3g s  %10.3g s/target'
+              % (r['name'], r['batch'], r['cold_s'], r['warm_s'], r['per_target_s']))
+    for r in results.get('routes', []):
+        print('%-22s %3d  %8.4f s  %8.1f req/s' % (r['name'], r['status'], r['latency_s'], r['requests_per_s']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
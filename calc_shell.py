@@ -1,13 +1,42 @@
+import time
+
 import numpy as np
 
+import neid_calculator.metrics as metrics
 import neid_calculator.neid_etcalc_public as etc
+import neid_calculator.result_cache as result_cache
 
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, Response, abort, current_app, flash, g, jsonify, make_response, redirect,
+    render_template, request, url_for
 )
 
 bp = Blueprint('calc_shell', __name__, url_prefix='/calc_shell')
 
+# the form routes go through a bounded cache of quantized requests
+NEID_RV_prec = result_cache.cached(etc.NEID_RV_prec)
+NEID_exptime_RV = result_cache.cached(etc.NEID_exptime_RV)
+NEID_exptime_SNR = result_cache.cached(etc.NEID_exptime_SNR)
+NEID_max_exptime = result_cache.cached(etc.NEID_max_exptime)
+NEID_order_profile = result_cache.cached(etc.NEID_order_profile)
+
+@bp.record_once
+def configure_cache(state):
+    config = state.app.config
+    result_cache.configure(maxsize=config.get('CALC_CACHE_SIZE', 4096),
+                           digits=config.get('CALC_CACHE_DIGITS', 6),
+                           path=config.get('CALC_CACHE_PATH'))
+
+@bp.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@bp.after_request
+def record_latency(response):
+    if 'request_start' in g:
+        metrics.observe('request_seconds', request.endpoint, time.perf_counter()-g.request_start)
+    return response
+
 @bp.route('/calculate_rv', methods=('GET', 'POST'))
 def calculate_rv(temperature_in=5500, exptime_in=300, vmag_in=8):
     if request.method == 'POST':
@@ -27,9 +56,9 @@ def calculate_rv(temperature_in=5500, exptime_in=300, vmag_in=8):
             error = 'Exposure time is required'
             
         if error is None:
-            rvprec=etc.NEID_RV_prec(temperature, vmag, exptime)
+            rvprec=NEID_RV_prec(temperature, vmag, exptime)
             if np.isnan(rvprec)==False:
-                maxexp=etc.NEID_max_exptime(temperature, vmag)
+                maxexp=NEID_max_exptime(temperature, vmag)
                 if maxexp==3600:
                     flash('Maximum recommended exposure time for this target is >3600 seconds', category='warning')
                 else:
@@ -44,6 +73,7 @@ def calculate_rv(temperature_in=5500, exptime_in=300, vmag_in=8):
 
 @bp.route('/calculate_snr', methods=('GET', 'POST'))
 def calculate_snr(temperature_in=5500, exptime_in=300, vmag_in=8, wavelength_in=552.97):
+    profile=None
     if request.method == 'POST':
 
         temperature = float(request.form['temperature'])
@@ -64,18 +94,25 @@ def calculate_snr(temperature_in=5500, exptime_in=300, vmag_in=8, wavelength_in=
             error = 'Wavelength required for SNR calculation'
             flash(error)
         if error is None:
-            snr=etc.NEID_SNR(temperature, vmag, exptime, wavelength)
-            maxexp=etc.NEID_max_exptime(temperature, vmag)
+            # one call gives every order; the page shows the requested one and the profile
+            profile=NEID_order_profile(temperature, vmag, exptime)
+            loc, matched = etc.NEID_order_match(wavelength)
+            maxexp=NEID_max_exptime(temperature, vmag)
             if maxexp==3600:
                 flash('Maximum recommended exposure time for this target is >3600 seconds', category='warning')
             else:
                 flash('Maximum recommended exposure time for this target is %d seconds' % maxexp, category='warning')
-            flash('SNR = %4.3f' % snr, category='message')
+            if matched:
+                flash('SNR = %4.3f' % profile['snr'][loc], category='message')
+            else:
+                flash('No order is centered within 0.1 nm of %.2f nm; the nearest is order %d at %.2f nm'
+                      % (wavelength, profile['order'][loc], profile['wavelength'][loc]))
         temperature_in=request.form['temperature']
         exptime_in=request.form['exptime']
         vmag_in=request.form['vmag']
         wavelength_in=request.form['wavelength']
-    return render_template('calc_shell/calculate_snr.html', temp=temperature_in, vm=vmag_in, et=exptime_in, wvl=wavelength_in)
+    return render_template('calc_shell/calculate_snr.html', temp=temperature_in, vm=vmag_in, et=exptime_in, wvl=wavelength_in,
+                           profile=profile)
 
 @bp.route('/calculate_exp_rv', methods=('GET', 'POST'))
 def calculate_exp_rv(temperature_in=5500, rvprec_in=1.0, vmag_in=8):
@@ -94,9 +131,9 @@ def calculate_exp_rv(temperature_in=5500, rvprec_in=1.0, vmag_in=8):
             error = 'Desired RV precision is required'
             
         if error is None:
-            exptime=etc.NEID_exptime_RV(temperature, vmag, rvprec)
+            exptime=NEID_exptime_RV(temperature, vmag, rvprec, quantize=True)
             if np.isnan(exptime)==False:
-                maxexp=etc.NEID_max_exptime(temperature, vmag)
+                maxexp=NEID_max_exptime(temperature, vmag)
                 if maxexp==3600:
                     flash('Maximum recommended exposure time for this target is >3600 seconds', category='warning')
                 else:
@@ -131,9 +168,9 @@ def calculate_exp_snr(temperature_in=5500, snr_in=100, vmag_in=8, wavelength_in=
             flash(error)
             
         if error is None:
-            exptime=etc.NEID_exptime_SNR(temperature, vmag, snr, wavelength)
+            exptime=NEID_exptime_SNR(temperature, vmag, snr, wavelength, quantize=True)
             if np.isnan(exptime)==False:
-                maxexp=etc.NEID_max_exptime(temperature, vmag)
+                maxexp=NEID_max_exptime(temperature, vmag)
                 if maxexp==3600:
                     flash('Maximum recommended exposure time for this target is >3600 seconds', category='warning')
                 else:
@@ -147,6 +184,135 @@ def calculate_exp_snr(temperature_in=5500, snr_in=100, vmag_in=8, wavelength_in=
         wavelength_in=request.form['wavelength']
     return render_template('calc_shell/calculate_exp_snr.html', temp=temperature_in, vm=vmag_in, sn=snr_in, wvl=wavelength_in)
 
+@bp.route('/api/cache', methods=('GET',))
+def api_cache():
+    return jsonify(result_cache.get_cache().stats())
+
+@bp.route('/metrics', methods=('GET',))
+def metrics_text():
+    text = metrics.prometheus_text()
+    stats = result_cache.get_cache().stats()
+    for name in ('hits', 'misses', 'evictions', 'shared_evictions'):
+        text += '# TYPE neid_cache_%s_total counter\nneid_cache_%s_total %d\n' % (name, name, stats[name])
+    text += '# TYPE neid_cache_size gauge\nneid_cache_size %d\n' % stats['size']
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @bp.route('/about', methods=('GET', 'POST'))
 def about():
-    return render_template('calc_shell/about.html')
\ No newline at end of file
+    return render_template('calc_shell/about.html')
+
+
+def _bad_request(message, status=400):
+    abort(make_response(jsonify(error=message), status))
+
+def _batch(fields, optional=None):
+    """
+    parse the targets of a JSON batch request into one array per field
+    the body is either a list of targets or {"targets": [...], ...}; each target
+    is an object with the same field names as the HTML forms. optional maps
+    fields to their default values
+    """
+    optional = optional or {}
+    payload = request.get_json(silent=True)
+    targets = payload.get('targets') if isinstance(payload, dict) else payload
+    if not isinstance(targets, list) or not targets:
+        _bad_request('expected a JSON list of targets or {"targets": [...]}')
+    max_batch = current_app.config.get('CALC_MAX_BATCH', 1000)
+    if len(targets) > max_batch:
+        _bad_request('at most %d targets per request' % max_batch, 413)
+
+    columns = {}
+    for field in fields + list(optional):
+        try:
+            columns[field] = np.array([float(target.get(field, optional.get(field)))
+                                       for target in targets])
+        except (AttributeError, TypeError, ValueError):
+            _bad_request('every target needs a numeric %s' % field)
+        # NaN and infinity would be echoed back as invalid JSON
+        if not np.all(np.isfinite(columns[field])):
+            _bad_request('every target needs a finite %s' % field)
+    return columns
+
+def _json_value(value):
+    return None if np.isnan(value) else float(value)
+
+def _batch_response(columns, results, exptime, in_bounds, matched=None):
+    """
+    per-target results with bounds and saturation flags; exptime is the exposure
+    time compared with the maximum recommended exposure time
+    """
+    maxexp = etc.NEID_max_exptime(columns['temperature'], columns['vmag'])
+    rows = []
+    for i in range(len(maxexp)):
+        row = {field: float(values[i]) for field, values in columns.items()}
+        row.update((field, _json_value(values[i])) for field, values in results.items())
+        row['in_bounds'] = bool(in_bounds[i])
+        if matched is not None:
+            row['wavelength_matched'] = bool(matched[i])
+        row['max_exptime'] = _json_value(maxexp[i])
+        row['saturated'] = bool(exptime[i] > maxexp[i])
+        rows.append(row)
+    return jsonify(results=rows)
+
+def _quantize():
+    payload = request.get_json(silent=True)
+    quantize = payload.get('quantize', True) if isinstance(payload, dict) else True
+    # only a JSON boolean; bool('false') would be True
+    if not isinstance(quantize, bool):
+        _bad_request('quantize must be true or false')
+    return quantize
+
+def _order_wavelength(columns):
+    """
+    wavelengths that match an order center, with unmatched ones replaced so the
+    batch can be evaluated in one call; returns them and the match mask
+    """
+    grids = etc.grid_store.get_store()
+    matched = etc.NEID_order_match(columns['wavelength'])[1]
+    return np.where(matched, columns['wavelength'], grids.wavelength_grid[0]), matched
+
+@bp.route('/api/rv', methods=('POST',))
+def api_rv():
+    columns = _batch(['temperature', 'vmag', 'exptime'])
+    rvprec, in_bounds = etc.NEID_RV_prec(columns['temperature'], columns['vmag'], columns['exptime'],
+                                         return_mask=True)
+    return _batch_response(columns, {'rv_precision': rvprec}, columns['exptime'], in_bounds)
+
+@bp.route('/api/snr', methods=('POST',))
+def api_snr():
+    columns = _batch(['temperature', 'vmag', 'exptime'], {'wavelength': 552.97})
+    wavelength, matched = _order_wavelength(columns)
+    snr, in_bounds = etc.NEID_SNR(columns['temperature'], columns['vmag'], columns['exptime'], wavelength,
+                                  return_mask=True)
+    return _batch_response(columns, {'snr': np.where(matched, snr, np.nan)}, columns['exptime'],
+                           in_bounds, matched)
+
+@bp.route('/api/exp_rv', methods=('POST',))
+def api_exp_rv():
+    columns = _batch(['temperature', 'vmag', 'rvprec'])
+    exptime, in_bounds = etc.NEID_exptime_RV(columns['temperature'], columns['vmag'], columns['rvprec'],
+                                             quantize=_quantize(), return_mask=True)
+    return _batch_response(columns, {'exptime': exptime}, exptime, in_bounds)
+
+@bp.route('/api/exp_snr', methods=('POST',))
+def api_exp_snr():
+    columns = _batch(['temperature', 'vmag', 'snr'], {'wavelength': 552.97})
+    wavelength, matched = _order_wavelength(columns)
+    exptime, in_bounds = etc.NEID_exptime_SNR(columns['temperature'], columns['vmag'], columns['snr'],
+                                              wavelength, quantize=_quantize(), return_mask=True)
+    exptime = np.where(matched, exptime, np.nan)
+    return _batch_response(columns, {'exptime': exptime}, exptime, in_bounds, matched)
+
+@bp.route('/api/profile', methods=('POST',))
+def api_profile():
+    columns = _batch(['temperature', 'vmag', 'exptime'])
+    profile, in_bounds = etc.NEID_order_profile(columns['temperature'], columns['vmag'], columns['exptime'],
+                                                return_mask=True)
+    rows = []
+    for i in range(len(in_bounds)):
+        row = {field: float(values[i]) for field, values in columns.items()}
+        row['in_bounds'] = bool(in_bounds[i])
+        row['snr'] = [_json_value(value) for value in profile['snr'][i]]
+        row['rv_precision'] = [_json_value(value) for value in profile['rv_precision'][i]]
+        rows.append(row)
+    return jsonify(order=profile['order'].tolist(), wavelength=profile['wavelength'].tolist(), results=rows)
@@ -0,0 +1,251 @@
+import argparse
+import collections
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+import neid_calculator.uncertainty as uncertainty
+
+
+"""
+run the calculator over a whole target catalogue
+
+    python -m neid_calculator.catalog targets.csv results.csv --workers 8
+
+the input is a CSV file or a FITS binary table with columns name, teff and vmag
+plus any of exptime, snr_goal, rv_goal and wavelength (column names are case
+insensitive; missing values are NaN). rows are read in chunks, evaluated by a
+process pool with the vectorized calculator functions and written to a CSV file
+as soon as each chunk is done, in input order, so memory stays flat for
+catalogues of any length. the grids are loaded before the pool is started, so
+forked workers share the memory-mapped cubes.
+
+with --samples N the teff_err and vmag_err columns (and teff_vmag_corr, their
+correlation) are propagated by Monte Carlo (see neid_calculator.uncertainty),
+and percentiles of every output are written as extra columns such as
+exptime_rv_p84. chunk i is seeded with (--seed, i), so a run is reproducible
+for a given chunk size.
+"""
+
+INPUT_COLUMNS = ('name', 'teff', 'vmag', 'exptime', 'snr_goal', 'rv_goal', 'wavelength',
+                 'teff_err', 'vmag_err', 'teff_vmag_corr')
+OUTPUT_COLUMNS = ('name', 'teff', 'vmag', 'exptime', 'wavelength', 'rv_precision', 'snr',
+                  'snr_goal', 'exptime_snr', 'rv_goal', 'exptime_rv', 'max_exptime')
+# outputs with Monte Carlo percentiles
+SAMPLED_COLUMNS = ('rv_precision', 'snr', 'exptime_snr', 'exptime_rv')
+
+
+def output_columns(samples=0, percentiles=uncertainty.PERCENTILES):
+    """
+    names of the output columns, with the percentile columns when samples>0
+    """
+    if not samples:
+        return OUTPUT_COLUMNS
+    return OUTPUT_COLUMNS+('in_bounds_fraction',)+tuple(
+        '%s_p%g' % (name, q) for name in SAMPLED_COLUMNS for q in percentiles)
+
+
+def _read_csv(path, chunk_size):
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        fields = {name.strip().lower(): name for name in reader.fieldnames}
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows)==chunk_size:
+                yield _columns(rows, fields)
+                rows = []
+        if rows:
+            yield _columns(rows, fields)
+
+
+def _columns(rows, fields):
+    chunk = {}
+    for column in INPUT_COLUMNS:
+        if column not in fields:
+            continue
+        values = [row[fields[column]] for row in rows]
+        if column=='name':
+            chunk[column] = values
+        else:
+            chunk[column] = np.array([float(v) if v.strip() else np.nan for v in values])
+    return chunk
+
+
+def _read_fits(path, chunk_size):
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        table = next(hdu for hdu in hdul if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)))
+        fields = {name.lower(): name for name in table.columns.names}
+        for start in range(0, table.header['NAXIS2'], chunk_size):
+            rows = table.data[start:start+chunk_size]
+            chunk = {}
+            for column in INPUT_COLUMNS:
+                if column not in fields:
+                    continue
+                values = rows[fields[column]]
+                if column=='name':
+                    chunk[column] = [str(v).strip() for v in values]
+                else:
+                    chunk[column] = np.array(values, dtype=np.double)
+            yield chunk
+
+
+def read_targets(path, chunk_size=10000):
+    """
+    iterate over a CSV or FITS target table in chunks of column arrays
+    path:          input file; .fits/.fit/.fits.gz files are read as FITS tables
+    chunk_size:    rows per chunk
+    """
+    if path.lower().endswith(('.fits', '.fit', '.fits.gz')):
+        return _read_fits(path, chunk_size)
+    return _read_csv(path, chunk_size)
+
+
+def evaluate(chunk, wavelength=552.97, quantize=False, samples=0,
+             percentiles=uncertainty.PERCENTILES, seed=0):
+    """
+    calculate every output column for one chunk of targets
+    chunk:         dict of column arrays as produced by read_targets
+    wavelength:    wavelength (nm) used when the table has no wavelength column
+    samples:       Monte Carlo samples per target for the percentile columns (0: none)
+    percentiles:   percentiles written for each sampled output
+    seed:          seed of the Monte Carlo samples of this chunk
+    """
+    teff = chunk['teff']
+    vmag = chunk['vmag']
+    n = len(teff)
+    nan = np.full(n, np.nan)
+    exptime = chunk.get('exptime', nan)
+    snr_goal = chunk.get('snr_goal', nan)
+    rv_goal = chunk.get('rv_goal', nan)
+    wvl = chunk.get('wavelength', np.full(n, wavelength))
+    wvl = np.where(np.isnan(wvl), wavelength, wvl)
+    # rows whose wavelength is not an order center get NaN for the SNR columns
+    grids = grid_store.get_store()
+    matched = etc.NEID_order_match(wvl)[1]
+    order_wvl = np.where(matched, wvl, grids.wavelength_grid[0])
+
+    result = collections.OrderedDict()
+    result['name'] = chunk.get('name', [''] * n)
+    result['teff'] = teff
+    result['vmag'] = vmag
+    result['exptime'] = exptime
+    result['wavelength'] = wvl
+    result['rv_precision'] = etc.NEID_RV_prec(teff, vmag, exptime)
+    result['snr'] = np.where(matched, etc.NEID_SNR(teff, vmag, exptime, order_wvl), np.nan)
+    result['snr_goal'] = snr_goal
+    result['exptime_snr'] = np.where(matched, etc.NEID_exptime_SNR(teff, vmag, snr_goal, order_wvl,
+                                                                   quantize=quantize), np.nan)
+    result['rv_goal'] = rv_goal
+    result['exptime_rv'] = etc.NEID_exptime_RV(teff, vmag, rv_goal, quantize=quantize)
+    result['max_exptime'] = etc.NEID_max_exptime(teff, vmag)
+    if samples:
+        zero = np.zeros(n)
+        spread = uncertainty.propagate(teff, vmag, np.nan_to_num(chunk.get('teff_err', zero)),
+                                       np.nan_to_num(chunk.get('vmag_err', zero)),
+                                       correlation=np.nan_to_num(chunk.get('teff_vmag_corr', zero)),
+                                       exptime=exptime, snr=snr_goal, rv_precision=rv_goal,
+                                       wavelength=wvl, n_samples=samples, q=percentiles, seed=seed,
+                                       quantize=quantize)
+        result['in_bounds_fraction'] = spread['in_bounds']
+        for name in SAMPLED_COLUMNS:
+            for i, q in enumerate(percentiles):
+                result['%s_p%g' % (name, q)] = spread[name][:, i]
+    return result
+
+
+def _init_worker():
+    grid_store.get_store()
+
+
+def _write(writer, result, names):
+    columns = [result[column] for column in names]
+    for row in zip(*columns):
+        writer.writerow([row[0]]+['' if np.isnan(v) else '%.6g' % v for v in row[1:]])
+
+
+def run(input_path, output_path, workers=None, chunk_size=10000, wavelength=552.97,
+        quantize=False, progress=True, samples=0, percentiles=uncertainty.PERCENTILES, seed=0):
+    """
+    evaluate a target table and write the results, in input order, to a CSV file
+    workers:       number of worker processes (default: all cpus; 1 runs in-process)
+    chunk_size:    rows per chunk handed to a worker
+    samples, percentiles, seed:  Monte Carlo uncertainty columns, see evaluate
+    returns the number of rows written
+    """
+    workers = workers or os.cpu_count() or 1
+    # load the grids before forking so the workers share them
+    grid_store.get_store()
+    chunks = read_targets(input_path, chunk_size)
+    start = time.time()
+    n_rows = 0
+    names = output_columns(samples, percentiles)
+
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+
+        def done(result):
+            nonlocal n_rows
+            _write(writer, result, names)
+            n_rows += len(result['teff'])
+            if progress:
+                elapsed = time.time()-start
+                sys.stderr.write('\r%d rows  %.1f s  %.0f rows/s' % (n_rows, elapsed, n_rows/max(elapsed, 1e-9)))
+                sys.stderr.flush()
+
+        if workers==1:
+            for i, chunk in enumerate(chunks):
+                done(evaluate(chunk, wavelength, quantize, samples, percentiles, (seed, i)))
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+                # a bounded window of chunks in flight keeps memory flat and the
+                # results are collected in submission order
+                pending = collections.deque()
+                for i, chunk in enumerate(chunks):
+                    pending.append(pool.apply_async(evaluate, (chunk, wavelength, quantize, samples,
+                                                               percentiles, (seed, i))))
+                    if len(pending)>=2*workers:
+                        done(pending.popleft().get())
+                while pending:
+                    done(pending.popleft().get())
+
+    if progress:
+        sys.stderr.write('\n')
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.catalog',
+                                     description='evaluate the NEID calculator for a target catalogue')
+    parser.add_argument('input', help='CSV file or FITS table of targets')
+    parser.add_argument('output', help='CSV file for the results')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cpus)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows per chunk')
+    parser.add_argument('--wavelength', type=float, default=552.97,
+                        help='wavelength (nm) for SNR when the table has no wavelength column')
+    parser.add_argument('--quantize', action='store_true',
+                        help='round exposure times up to the 2 s steps used by the web calculator')
+    parser.add_argument('--samples', type=int, default=0,
+                        help='Monte Carlo samples per target for teff_err/vmag_err percentiles')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=list(uncertainty.PERCENTILES),
+                        help='percentiles written with --samples')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the Monte Carlo samples')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    run(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+        wavelength=args.wavelength, quantize=args.quantize, progress=not args.quiet,
+        samples=args.samples, percentiles=tuple(args.percentiles), seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
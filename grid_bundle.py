@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+
+"""
+single-file binary bundle of the NEID model grids
+
+the bundle holds every grid in one file that numpy can memory-map without
+copying or byte swapping, so loading it needs neither astropy nor a FITS header
+parse, and worker processes share the cubes through the page cache.
+
+layout:
+    8 bytes       magic b'NEIDGRID'
+    uint32 (le)   format version
+    uint32 (le)   length of the manifest in bytes
+    manifest      UTF-8 JSON: version, the axis grids, order numbers and
+                  wavelengths, softlimit table, grid checksum, size and sha256
+                  of the FITS files it was built from, and the offset, shape
+                  and dtype of every array
+    arrays        little-endian, C order, each aligned to ALIGNMENT bytes
+
+the axis grids, order table and softlimit are small and also stored in the
+manifest in full. the cubes can be stored as float32 to halve the size; their
+values then differ from the FITS grids by the float32 rounding. grid_store
+ignores a bundle whose FITS files have changed since it was built.
+
+    python -m neid_calculator.grid_bundle build [--float32] [--source DIR] [--output FILE]
+    python -m neid_calculator.grid_bundle verify [FILE]
+"""
+
+BUNDLE_FILE = 'neid_grids.bundle'
+BUNDLE_VERSION = 1
+MAGIC = b'NEIDGRID'
+ALIGNMENT = 64
+
+# arrays stored in the bundle, in file order
+ARRAYS = ('exptime_grid', 'teff_grid', 'vmag_grid', 'order_grid', 'wavelength_grid', 'softlimit',
+          'rvprec_grid', 'rvprec_grid_order', 'snr_grid_order')
+CUBES = ('rvprec_grid', 'rvprec_grid_order', 'snr_grid_order')
+
+_HEADER = struct.Struct('<8sII')
+
+
+def checksum(arrays):
+    """
+    sha256 of the axis grids and model cubes, as GridStore.checksum() computes it
+    """
+    digest = hashlib.sha256()
+    for name in ('exptime_grid', 'teff_grid', 'vmag_grid', 'wavelength_grid',
+                 'rvprec_grid', 'rvprec_grid_order', 'snr_grid_order'):
+        digest.update(np.ascontiguousarray(arrays[name], dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def _align(n):
+    return -(-n//ALIGNMENT)*ALIGNMENT
+
+
+def write(arrays, output, cube_dtype='<f8', sources=None):
+    """
+    write a bundle
+    arrays:        mapping with every name in ARRAYS
+    output:        bundle file name
+    cube_dtype:    '<f8' or '<f4' for the model cubes (axes are always float64)
+    sources:       size and sha256 of the FITS files (see grid_store.source_files)
+    """
+    data = {name: np.ascontiguousarray(arrays[name], dtype=cube_dtype if name in CUBES else '<f8')
+            for name in ARRAYS}
+    manifest = {'version': BUNDLE_VERSION,
+                'grid_checksum': checksum(data),
+                'exptime': data['exptime_grid'].tolist(),
+                'teff': data['teff_grid'].tolist(),
+                'vmag': data['vmag_grid'].tolist(),
+                'orders': data['order_grid'].tolist(),
+                'wavelengths': data['wavelength_grid'].tolist(),
+                'softlimit': data['softlimit'].tolist(),
+                'sources': sources or {},
+                'arrays': {}}
+
+    # the offsets are relative to the start of the array section, so the
+    # manifest size does not depend on them
+    offset = 0
+    for name in ARRAYS:
+        manifest['arrays'][name] = {'offset': offset, 'shape': list(data[name].shape),
+                                    'dtype': data[name].dtype.str,
+                                    'sha256': hashlib.sha256(data[name].tobytes()).hexdigest()}
+        offset = _align(offset+data[name].nbytes)
+    text = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    start = _align(_HEADER.size+len(text))
+
+    tmp = output+'.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, BUNDLE_VERSION, len(text)))
+        f.write(text)
+        for name in ARRAYS:
+            f.seek(start+manifest['arrays'][name]['offset'])
+            f.write(data[name].tobytes())
+        f.truncate(start+offset)
+    # a half-written bundle must never be picked up by a running server
+    os.replace(tmp, output)
+    return output
+
+
+def read_manifest(path):
+    """
+    manifest of a bundle and the file offset of its array section
+    """
+    with open(path, 'rb') as f:
+        magic, version, length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic!=MAGIC:
+            raise ValueError('%s is not a NEID grid bundle' % path)
+        if version!=BUNDLE_VERSION:
+            raise ValueError('%s has bundle version %d, expected %d' % (path, version, BUNDLE_VERSION))
+        manifest = json.loads(f.read(length).decode('utf-8'))
+    return manifest, _align(_HEADER.size+length)
+
+
+def read(path):
+    """
+    memory-map the arrays of a bundle; returns a dict of read-only arrays keyed
+    by the names in ARRAYS and the manifest
+    """
+    manifest, start = read_manifest(path)
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, info in manifest['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        offset = start+info['offset']
+        size = int(np.prod(info['shape']))*dtype.itemsize
+        arrays[name] = raw[offset:offset+size].view(dtype).reshape(info['shape'])
+    return arrays, manifest
+
+
+def build(source=None, output=None, float32=False):
+    """
+    convert the FITS grids into a bundle
+    source:        directory holding the FITS grids (default: the grid store path)
+    output:        bundle file (default: BUNDLE_FILE in the source directory)
+    float32:       store the model cubes as float32
+    """
+    import neid_calculator.grid_store as grid_store
+
+    source = source or grid_store.default_path()
+    output = output or os.path.join(source, BUNDLE_FILE)
+    return write(grid_store.read_fits(source), output, cube_dtype='<f4' if float32 else '<f8',
+                 sources=grid_store.source_files(source))
+
+
+def verify(path):
+    """
+    check the per-array checksums and the grid checksum of a bundle, and that
+    the FITS files next to it are the ones it was built from
+    returns a list of problems, empty when the bundle is intact
+    """
+    import neid_calculator.grid_store as grid_store
+
+    arrays, manifest = read(path)
+    problems = ['%s changed since the bundle was built' % name
+                for name in grid_store.stale(manifest, os.path.dirname(os.path.abspath(path)))]
+    for name, info in manifest['arrays'].items():
+        if hashlib.sha256(np.ascontiguousarray(arrays[name]).tobytes()).hexdigest()!=info['sha256']:
+            problems.append('%s: checksum mismatch' % name)
+    if checksum(arrays)!=manifest['grid_checksum']:
+        problems.append('grid checksum mismatch')
+    for name, key in (('exptime_grid', 'exptime'), ('teff_grid', 'teff'), ('vmag_grid', 'vmag'),
+                      ('order_grid', 'orders'), ('wavelength_grid', 'wavelengths'),
+                      ('softlimit', 'softlimit')):
+        if not np.array_equal(arrays[name], manifest[key]):
+            problems.append('%s differs from the manifest' % name)
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.grid_bundle',
+                                     description='build or verify the binary grid bundle')
+    parser.add_argument('command', choices=('build', 'verify'))
+    parser.add_argument('file', nargs='?', help='bundle to verify')
+    parser.add_argument('--source', help='directory holding the FITS grids')
+    parser.add_argument('--output', help='bundle file to write')
+    parser.add_argument('--float32', action='store_true', help='store the model cubes as float32')
+    args = parser.parse_args(argv)
+
+    if args.command=='build':
+        output = build(args.source, args.output, args.float32)
+        print('%s written (%d bytes)' % (output, os.path.getsize(output)))
+        return 0
+    import neid_calculator.grid_store as grid_store
+    path = args.file or os.path.join(grid_store.default_path(), BUNDLE_FILE)
+    problems = verify(path)
+    for problem in problems:
+        print(problem)
+    print('FAILED' if problems else 'OK')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
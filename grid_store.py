@@ -0,0 +1,282 @@
+import hashlib
+import os
+import threading
+import warnings
+
+import numpy as np
+
+import neid_calculator.grid_bundle as grid_bundle
+import neid_calculator.metrics as metrics
+import neid_calculator.nd_grid as nd_grid
+
+
+"""
+process-wide store for the NEID model grids
+
+the grids are read once per process and shared by every calculator function.
+by default they are read from the directory this module lives in; set the
+NEID_GRID_PATH environment variable or call configure() to point the store at
+another directory. call reload() after the grid files have been updated.
+
+a directory holding a grid bundle (see neid_calculator.grid_bundle) is loaded
+from the bundle, without importing astropy; failing that, a chunked grid file
+(see neid_calculator.nd_grid) is opened and its chunks are read as they are
+needed; otherwise the FITS files are read. set NEID_GRID_FORMAT to bundle,
+chunked or fits to choose one. a bundle or chunked grid records the FITS files
+it was built from; when FITS files next to it differ from those, it is stale,
+and the FITS files are read instead (with a warning to rebuild it).
+"""
+
+GRID_FILES = {
+    'exptime': 'photon_grid_exptime.fits',
+    'teff': 'photon_grid_teff.fits',
+    'vmag': 'photon_grid_vmag.fits',
+    'orders': 'order_wvl_centers.fits',
+    'rvprec': 'dv_uncertainty_master.fits',
+    'rvprec_order': 'dv_uncertainty_master_order.fits',
+    'snr_order': 'snr_master_order.fits',
+}
+
+# SNR per order at which the detector reaches 60% of full well
+SOFTLIMIT = np.array([497.82248, 500.46307, 499.61078, 495.75638, 495.59677, 497.53268,
+       494.92285, 497.87125, 495.24042, 499.50885, 499.4121 , 495.15826,
+       498.5816 , 498.41797, 494.5738 , 498.28055, 495.77396, 495.66986,
+       497.76923, 495.65466, 495.5136 , 494.9543 , 497.7236 , 496.294  ,
+       494.54578, 492.45773, 493.8629 , 495.3245 , 496.50537, 497.20462,
+       496.3666 , 493.56155, 495.66016, 495.95648, 495.29364, 493.72418,
+       495.75903, 496.19632, 494.97125, 492.46533, 496.4472 , 494.52365,
+       493.13345, 494.53046, 495.96414, 494.08124, 491.92264, 494.0127 ,
+       495.47772, 495.2882 , 495.43652, 494.86865, 495.158  , 495.0169 ,
+       494.81766, 495.0668 , 495.3031 , 493.20224, 494.71045, 493.0483 ,
+       495.01123, 494.97443, 492.57593, 493.84567, 490.0411 , 493.2728 ,
+       491.09906, 494.50082, 493.13843, 494.31946, 494.4462 , 491.75977,
+       493.00977, 491.4752 , 491.64948, 492.39023, 492.10922, 489.91223,
+       494.3898 , 494.33267, 490.79178, 493.4196 , 491.94476, 494.1685 ,
+       492.94263, 494.19852, 489.60358, 492.3478 , 490.21204, 493.80936,
+       489.8438 , 490.6124 , 490.24118, 493.70288, 491.47467])
+
+_lock = threading.Lock()
+_store = None
+_path = None
+
+
+FORMATS = {'bundle': grid_bundle.BUNDLE_FILE, 'chunked': nd_grid.GRID_FILE}
+
+
+def _read_only(data, copy=False):
+    if isinstance(data, nd_grid.ChunkedCube):
+        return data
+    if copy:
+        data = np.array(data, dtype=np.double)
+    data.flags.writeable = False
+    return data
+
+
+def grid_format(path):
+    """
+    'bundle', 'chunked' or 'fits': NEID_GRID_FORMAT, or else the first of these
+    found in the directory
+    """
+    chosen = os.environ.get('NEID_GRID_FORMAT')
+    if chosen:
+        return chosen
+    for name, filename in FORMATS.items():
+        if os.path.exists(os.path.join(path, filename)):
+            return name
+    return 'fits'
+
+
+def fingerprint(path):
+    """
+    modification time and size of every grid file, used to notice updated grids;
+    the FITS files are included whenever they are present, since they decide
+    whether a bundle or chunked grid is stale
+    """
+    stats = []
+    chosen = grid_format(path)
+    names = sorted(GRID_FILES.values())
+    if chosen in FORMATS:
+        names = [FORMATS[chosen]]+[name for name in names if os.path.exists(os.path.join(path, name))]
+    for name in names:
+        stat = os.stat(os.path.join(path, name))
+        stats.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+
+def source_files(path):
+    """
+    size and sha256 of the FITS grid files present in a directory, as recorded
+    in the manifest of a bundle or chunked grid built from them
+    """
+    sources = {}
+    for name in sorted(GRID_FILES.values()):
+        filename = os.path.join(path, name)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                sources[name] = {'size': os.path.getsize(filename), 'sha256': hashlib.sha256(f.read()).hexdigest()}
+    return sources
+
+
+def stale(manifest, path):
+    """
+    names of the FITS files in path that differ from the ones a bundle or
+    chunked grid manifest was built from (all present ones when it does not
+    record them)
+    """
+    recorded = manifest.get('sources', {})
+    return [name for name, info in source_files(path).items() if recorded.get(name)!=info]
+
+
+def read_fits(path):
+    """
+    read the FITS grids in a directory; returns a dict of arrays named as the
+    GridStore attributes. the cubes are memory-mapped from the files
+    """
+    from astropy.io import fits
+
+    data = {}
+    for key, name in GRID_FILES.items():
+        with fits.open(os.path.join(path, name), memmap=True) as hdul:
+            data[key] = hdul[0].data
+    return {'exptime_grid': np.array(data['exptime'], dtype=np.double),
+            'teff_grid': np.array(data['teff'], dtype=np.double),
+            'vmag_grid': np.array(data['vmag'], dtype=np.double),
+            'order_grid': np.array(data['orders'][0], dtype=np.double),
+            'wavelength_grid': np.array(data['orders'][1], dtype=np.double),
+            'rvprec_grid': data['rvprec'],
+            'rvprec_grid_order': data['rvprec_order'],
+            'snr_grid_order': data['snr_order'],
+            'softlimit': SOFTLIMIT}
+
+
+class GridStore(object):
+    """
+    read-only view of the model grids in one directory
+
+    exptime_grid, teff_grid, vmag_grid:  axis grids (native float64 copies)
+    logexp:                              log10 of exptime_grid
+    order_grid, wavelength_grid:         order numbers and order centers (nm)
+    rvprec_grid:                         RV precision cube (exptime, vmag, teff)
+    rvprec_grid_order, snr_grid_order:   per-order cubes (order, exptime, vmag, teff),
+                                         memory-mapped from the bundle or FITS files,
+                                         or nd_grid.ChunkedCube from a chunked grid
+    softlimit:                           per-order SNR at 60% full well
+    fingerprint:                         mtime and size of the grid files when loaded
+    source:                              'bundle', 'chunked' or 'fits' (also when a
+                                         stale bundle or chunked grid was skipped)
+    """
+
+    def __init__(self, path):
+        with metrics.stage('grid_load'):
+            self._load(path)
+        self._cache = {}
+
+    def _load(self, path):
+        self.path = path
+        self.fingerprint = fingerprint(path)
+        self.source = grid_format(path)
+        if self.source in FORMATS:
+            filename = os.path.join(path, FORMATS[self.source])
+            reader = grid_bundle if self.source=='bundle' else nd_grid
+            changed_files = stale(reader.read_manifest(filename)[0], path)
+            if changed_files:
+                warnings.warn('%s is stale (%s changed since it was built); reading the FITS grids. '
+                              'rebuild it with python -m neid_calculator.%s build'
+                              % (filename, ', '.join(changed_files), reader.__name__.split('.')[-1]))
+                self.source = 'fits'
+        if self.source=='bundle':
+            data, manifest = grid_bundle.read(os.path.join(path, grid_bundle.BUNDLE_FILE))
+            # the bundle knows its checksum, so it need not be hashed again
+            self._checksum = manifest['grid_checksum']
+        elif self.source=='chunked':
+            grid = nd_grid.NDGrid(os.path.join(path, nd_grid.GRID_FILE))
+            data = grid.store_arrays()
+            self._checksum = grid.manifest['grid_checksum']
+        else:
+            data = read_fits(path)
+            self._checksum = None
+
+        self.exptime_grid = _read_only(data['exptime_grid'], copy=True)
+        self.teff_grid = _read_only(data['teff_grid'], copy=True)
+        self.vmag_grid = _read_only(data['vmag_grid'], copy=True)
+        self.logexp = _read_only(np.log10(self.exptime_grid))
+        self.order_grid = _read_only(data['order_grid'], copy=True)
+        self.wavelength_grid = _read_only(data['wavelength_grid'], copy=True)
+        self.rvprec_grid = _read_only(data['rvprec_grid'])
+        self.rvprec_grid_order = _read_only(data['rvprec_grid_order'])
+        self.snr_grid_order = _read_only(data['snr_grid_order'])
+        self.softlimit = _read_only(data['softlimit'], copy=True)
+
+    def checksum(self):
+        """
+        sha256 of the axis grids and model cubes
+        """
+        if self._checksum is None:
+            self._checksum = grid_bundle.checksum({name: getattr(self, name) for name in grid_bundle.ARRAYS})
+        return self._checksum
+
+    def cached(self, key, factory):
+        """
+        return an object derived from the grids (index maps, interpolators),
+        building it with factory() the first time it is asked for
+        """
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache.setdefault(key, factory())
+        return value
+
+
+def default_path():
+    """
+    directory the grids are read from when configure() has not been called
+    """
+    return os.environ.get('NEID_GRID_PATH', os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_store():
+    """
+    return the process-wide GridStore, loading it on first use
+    """
+    global _store
+    store = _store
+    if store is None:
+        with _lock:
+            if _store is None:
+                _store = GridStore(_path or default_path())
+            store = _store
+    return store
+
+
+def configure(path):
+    """
+    read the grids from a different directory; the store is reloaded on next use
+    path:          directory containing the grid bundle or FITS files
+    """
+    global _store, _path
+    with _lock:
+        _path = path
+        _store = None
+
+
+def changed():
+    """
+    True when the grid files have been modified since the store was loaded
+    """
+    store = _store
+    if store is None:
+        return False
+    try:
+        return fingerprint(store.path)!=store.fingerprint
+    except OSError:
+        return True
+
+
+def reload():
+    """
+    re-read the grid files (e.g. after the model grids have been updated)
+    and return the new store
+    """
+    global _store
+    with _lock:
+        _store = GridStore(_path or default_path())
+        return _store
@@ -0,0 +1,214 @@
+import numpy as np
+
+import neid_calculator.metrics as metrics
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+"""
+interpolation engine behind neid_etcalc_public
+
+AxisMap turns axis values (teff, vmag, exptime) into fractional grid indices.
+it evaluates the same not-a-knot cubic spline through (grid value, index) that
+scipy's InterpolatedUnivariateSpline fits, converted once to piecewise
+polynomial coefficients, so a lookup is a searchsorted and a Horner step (and a
+subtraction and a division on the evenly spaced axes). Trilinear blends the
+eight corners of the cell holding each fractional index in a model cube,
+optionally offset by an integer order.
+
+both work on whole arrays, and write into an out= buffer when one is given.
+when numba is installed the trilinear kernel is compiled and needs no
+temporaries at all.
+
+the results agree with the previous scipy path (InterpolatedUnivariateSpline
+index maps and a RegularGridInterpolator over index axes) to a relative
+difference of TOLERANCE; only the order of the floating point operations differs.
+"""
+
+# relative difference to the scipy spline/RegularGridInterpolator path
+TOLERANCE = 1e-12
+
+# corner offsets of a cell along the (exptime, vmag, teff) axes
+_CORNERS = np.array([[0, 0, 0], [0, 0, 1], [0, 1, 0], [0, 1, 1],
+                     [1, 0, 0], [1, 0, 1], [1, 1, 0], [1, 1, 1]])
+
+
+class AxisMap(object):
+    """
+    map from axis values onto fractional grid indices
+    grid:          increasing axis values
+    log:           map log10(value) instead of value (the exptime axis)
+
+    indices are clipped to [0, len(grid)-1]. an evenly spaced axis (teff, vmag)
+    maps linearly, which is what the spline reduces to there
+    """
+
+    def __init__(self, grid, log=False):
+        from scipy.interpolate import PPoly, make_interp_spline
+
+        self.grid = np.asarray(grid, dtype=np.double)
+        self.log = log
+        self.size = len(self.grid)
+        self.x = np.log10(self.grid) if log else self.grid
+        step = np.diff(self.x)
+        self.linear = bool(np.allclose(step, step[0], rtol=1e-12, atol=0))
+        self.origin, self.step = self.x[0], step[0]
+        spline = make_interp_spline(self.x, np.arange(self.size, dtype=np.double), k=3)
+        poly = PPoly.from_spline(spline)
+        # drop the zero-width pieces at the repeated end knots
+        keep = np.diff(poly.x)>0
+        self.breaks = np.ascontiguousarray(poly.x[:-1][keep])
+        self.coeffs = np.ascontiguousarray(poly.c[:, keep])
+
+    def _poly(self, x, derivative=False):
+        piece = np.searchsorted(self.breaks, x, side='right')-1
+        np.clip(piece, 0, len(self.breaks)-1, out=piece)
+        dx = x-self.breaks[piece]
+        a, b, c, d = self.coeffs[:, piece]
+        value = ((a*dx+b)*dx+c)*dx+d
+        if derivative:
+            return value, (3*a*dx+2*b)*dx+c
+        return value
+
+    def __call__(self, values, out=None):
+        x = np.log10(values) if self.log else np.asarray(values, dtype=np.double)
+        if self.linear:
+            index = np.subtract(x, self.origin, out=out)
+            index /= self.step
+        else:
+            index = self._poly(x)
+            if out is not None:
+                out[...] = index
+                index = out
+        return np.clip(index, 0, self.size-1, out=index)
+
+    def inverse(self, index, tol):
+        """
+        axis values at fractional indices, to within tol (in axis units, i.e.
+        seconds for the exptime axis)
+
+        safeguarded Newton iterations on the spline inside the grid cell that
+        holds each index; the map is monotone, so the cell brackets the root
+        """
+        index = np.asarray(index, dtype=np.double)
+        cell = np.clip(np.floor(index).astype(int), 0, self.size-2)
+        lo, hi = self.x[cell], self.x[cell+1]
+        x = lo+(hi-lo)*(index-cell)
+        if not self.linear:
+            for iteration in range(1, 51):
+                value, slope = self._poly(x, derivative=True)
+                above = value>index
+                hi = np.where(above, x, hi)
+                lo = np.where(above, lo, x)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    guess = x-(value-index)/slope
+                # fall back on bisection when Newton leaves the bracket
+                guess = np.where((guess>=lo) & (guess<=hi), guess, 0.5*(lo+hi))
+                change = np.abs(guess-x)
+                x = guess
+                if self.log:
+                    change *= np.log(10)*10**x
+                if not np.any(change>=tol):
+                    break
+            metrics.count('solver_iterations', iteration)
+        return np.clip(10**x if self.log else x, self.grid[0], self.grid[-1])
+
+
+def _trilinear_numpy(flat, strides, last, indices, order_offset, out):
+    cells = np.minimum(indices.astype(np.intp), last)
+    fracs = indices-cells
+    base = cells@strides
+    if order_offset is not None:
+        base = base+order_offset
+    corners = np.take(flat, base[..., np.newaxis]+_CORNERS@strides).reshape(base.shape+(2, 2, 2))
+    # blend along teff, then vmag, then exptime
+    corners = corners[..., 0]+(corners[..., 1]-corners[..., 0])*fracs[..., 2, np.newaxis, np.newaxis]
+    corners = corners[..., 0]+(corners[..., 1]-corners[..., 0])*fracs[..., 1, np.newaxis]
+    out[...] = corners[..., 0]+(corners[..., 1]-corners[..., 0])*fracs[..., 0]
+    return out
+
+
+def _trilinear_loop(flat, strides, last, indices, order_offset, out):
+    # indices (n, 3), order_offset (n,), out (n,); compiled with numba when available
+    for i in range(out.shape[0]):
+        base = order_offset[i]
+        f0 = indices[i, 0]
+        c0 = min(int(f0), last[0])
+        f0 -= c0
+        f1 = indices[i, 1]
+        c1 = min(int(f1), last[1])
+        f1 -= c1
+        f2 = indices[i, 2]
+        c2 = min(int(f2), last[2])
+        f2 -= c2
+        base += c0*strides[0]+c1*strides[1]+c2*strides[2]
+        v00 = flat[base]+(flat[base+strides[2]]-flat[base])*f2
+        corner = base+strides[1]
+        v01 = flat[corner]+(flat[corner+strides[2]]-flat[corner])*f2
+        corner = base+strides[0]
+        v10 = flat[corner]+(flat[corner+strides[2]]-flat[corner])*f2
+        corner = base+strides[0]+strides[1]
+        v11 = flat[corner]+(flat[corner+strides[2]]-flat[corner])*f2
+        v0 = v00+(v01-v00)*f1
+        v1 = v10+(v11-v10)*f1
+        out[i] = v0+(v1-v0)*f0
+    return out
+
+
+if numba is not None:
+    _trilinear_loop = numba.njit(cache=True, nogil=True)(_trilinear_loop)
+
+
+class Trilinear(object):
+    """
+    trilinear interpolation in a model cube over its (exptime, vmag, teff) index axes
+    cube:          (exptime, vmag, teff) cube, or (order, exptime, vmag, teff) for
+                   the per-order cubes
+    use_numba:     use the compiled kernel (default: when numba is installed)
+    """
+
+    def __init__(self, cube, use_numba=None):
+        self.shape = cube.shape
+        self.use_numba = numba is not None if use_numba is None else use_numba
+        if self.use_numba:
+            # the compiled kernel needs native byte order
+            cube = np.ascontiguousarray(cube, dtype=np.double)
+        self.flat = np.ascontiguousarray(cube).reshape(-1)
+        strides = np.cumprod((1,)+self.shape[::-1][:-1])[::-1]
+        self.order_stride = int(strides[0]) if len(self.shape)==4 else 0
+        self.strides = np.ascontiguousarray(strides[-3:], dtype=np.intp)
+        self.last = np.array(self.shape[-3:], dtype=np.intp)-2
+
+    def __call__(self, indices, order=None, out=None):
+        """
+        values at fractional (exptime, vmag, teff) indices
+        indices:       array (..., 3) of indices inside the cube
+        order:         integer positions along the order axis of a per-order cube,
+                       broadcast against indices[..., 0]
+        out:           optional float64 output buffer of the broadcast shape
+        """
+        indices = np.asarray(indices, dtype=np.double)
+        shape = indices.shape[:-1]
+        if order is not None:
+            order = np.asarray(order, dtype=np.intp)
+            shape = np.broadcast_shapes(shape, order.shape)
+        elif len(self.shape)==4:
+            raise ValueError('a per-order cube needs order positions')
+        if out is None:
+            out = np.empty(shape)
+
+        if self.use_numba:
+            flat_indices = np.ascontiguousarray(np.broadcast_to(indices, shape+(3,)).reshape(-1, 3))
+            offset = np.zeros(flat_indices.shape[0], dtype=np.intp)
+            if order is not None:
+                offset += np.broadcast_to(order, shape).reshape(-1)*self.order_stride
+            result = out.reshape(-1)
+            _trilinear_loop(self.flat, self.strides, self.last, flat_indices, offset, result)
+            if not np.shares_memory(result, out):
+                out[...] = result.reshape(shape)
+            return out
+        offset = None if order is None else order*self.order_stride
+        return _trilinear_numpy(self.flat, self.strides, self.last, indices, offset, out)
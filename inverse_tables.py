@@ -0,0 +1,310 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+inverse lookup tables for the exposure time functions
+
+the root solver brackets each exposure time between the two exptime nodes whose
+interpolated values straddle the target, and then solves inside that cell. the
+tables remove the first step: build() finds the bracketing cell on a lattice
+that follows the grid cells (refine points per teff and vmag cell, in fractional
+grid index, and log-spaced targets) for every order, and stores the cell number
+as uint8 in .npy files next to a manifest.json. a lookup takes the cell of the
+nearest lattice point, moves it by whole cells until it brackets the target (at
+most a step or two off the lattice), and solves inside it exactly as the solver
+does, from two interpolated nodes instead of all of them. lookups therefore
+agree with the solver to within its tolerance (MAX_DEVIATION), and the cost does
+not depend on how faint the target is.
+
+    python -m neid_calculator.inverse_tables build [--output DIR]
+    python -m neid_calculator.inverse_tables validate [--output DIR]
+
+the tables are read from NEID_INVERSE_TABLES, or the directory given to
+configure(), or else inverse_tables/ next to the grids. they are tied to the
+grids they were built from: the manifest records the grid checksum and
+load_tables() refuses tables built from other grids. validate exits non-zero
+when a lookup deviates from the solver by more than MAX_DEVIATION seconds or
+leaves a target unanswered.
+"""
+
+TABLE_VERSION = 2
+
+# largest accepted deviation (s) of a lookup from the root solver (tol=1e-3)
+MAX_DEVIATION = 1e-2
+
+# cube, exposure time decreases with the target (RV precision) or increases (SNR)
+TABLES = {
+    'snr': ('snr_grid_order', False),
+    'rv': ('rvprec_grid', True),
+    'rv_order': ('rvprec_grid_order', True),
+}
+
+_lock = threading.Lock()
+_tables = None
+_path = None
+
+
+def default_output(grids=None):
+    grids = grids or grid_store.get_store()
+    return os.path.join(grids.path, 'inverse_tables')
+
+
+def configure(path):
+    """
+    read the tables from a different directory (overrides NEID_INVERSE_TABLES)
+    """
+    global _path
+    with _lock:
+        _path = path
+
+
+def table_path(grids=None):
+    """
+    directory the tables are read from when no path is given
+    """
+    return _path or os.environ.get('NEID_INVERSE_TABLES') or default_output(grids)
+
+
+def _axis(start, stop, num):
+    return {'start': float(start), 'step': float((stop-start)/(num-1)), 'num': int(num)}
+
+
+def _axis_values(axis):
+    return axis['start']+axis['step']*np.arange(axis['num'])
+
+
+def _node_values(grids, cube_name, exptime_index, vmag_index, teff_index, order_loc):
+    """
+    cube values at integer exptime nodes and fractional vmag and teff indices,
+    computed as in neid_etcalc_public._exptime_nodes
+    """
+    indices = np.empty((len(exptime_index), 3))
+    indices[:,0] = exptime_index
+    indices[:,1] = vmag_index
+    indices[:,2] = teff_index
+    return etc._interpolator(grids, cube_name)(indices, order_loc)
+
+
+def build(output=None, teff_refine=2, vmag_refine=4, n_targets=96, chunk=20000, verbose=True):
+    """
+    build the inverse tables from the current grid store and write them to output
+    output:        directory for manifest.json and the .npy tables
+    teff_refine:   table points per teff grid cell
+    vmag_refine:   table points per vmag grid cell
+    n_targets:     number of log-spaced target values per table
+    chunk:         number of lattice points evaluated at once
+    """
+    grids = grid_store.get_store()
+    output = output or default_output(grids)
+    os.makedirs(output, exist_ok=True)
+
+    # lattices in fractional grid index, so the points follow the grid cells
+    teff_axis = _axis(0, len(grids.teff_grid)-1, teff_refine*(len(grids.teff_grid)-1)+1)
+    vmag_axis = _axis(0, len(grids.vmag_grid)-1, vmag_refine*(len(grids.vmag_grid)-1)+1)
+    manifest = {'version': TABLE_VERSION, 'grid_checksum': grids.checksum(),
+                'teff_index': teff_axis, 'vmag_index': vmag_axis, 'tables': {}}
+    n_exp = len(grids.exptime_grid)
+
+    for kind, (cube_name, decreasing) in TABLES.items():
+        cube = getattr(grids, cube_name)
+        n_order = cube.shape[0] if cube.ndim==4 else 1
+        target_axis = _axis(np.log10(np.min(cube)), np.log10(np.max(cube)), n_targets)
+        order, teff, vmag = [a.ravel() for a in np.meshgrid(np.arange(n_order), _axis_values(teff_axis),
+                                                             _axis_values(vmag_axis), indexing='ij')]
+        target = 10**_axis_values(target_axis)
+        if decreasing:
+            target = -target
+        table = np.empty((len(order), n_targets), dtype=np.uint8)
+        for start in range(0, len(order), chunk):
+            part = slice(start, start+chunk)
+            n = len(order[part])
+            indices = np.empty((n, n_exp, 3))
+            indices[...,0] = np.arange(n_exp)
+            indices[...,1] = vmag[part,np.newaxis]
+            indices[...,2] = teff[part,np.newaxis]
+            order_loc = order[part,np.newaxis] if cube.ndim==4 else None
+            nodes = etc._interpolator(grids, cube_name)(indices, order_loc)
+            if decreasing:
+                nodes = -nodes
+            # first node that reaches each target; n_exp when none does
+            table[part] = np.count_nonzero(nodes[:,np.newaxis,:]<target[np.newaxis,:,np.newaxis], axis=2)
+        filename = kind+'.npy'
+        table = table.reshape((n_order, teff_axis['num'], vmag_axis['num'], n_targets))
+        np.save(os.path.join(output, filename), table)
+        with open(os.path.join(output, filename), 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        manifest['tables'][kind] = {'file': filename, 'target': target_axis,
+                                    'decreasing': decreasing, 'sha256': checksum}
+        if verbose:
+            print('%s: %s table written to %s' % (kind, 'x'.join(map(str, table.shape)), filename))
+
+    with open(os.path.join(output, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return output
+
+
+class InverseTables(object):
+    """
+    memory-mapped inverse tables read from one build directory
+    """
+
+    def __init__(self, path, grids):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version')!=TABLE_VERSION:
+            raise ValueError('inverse tables in %s have version %s, expected %d; rebuild them'
+                             % (path, manifest.get('version'), TABLE_VERSION))
+        if manifest['grid_checksum']!=grids.checksum():
+            raise ValueError('inverse tables in %s were built from different grids; rebuild them' % path)
+        self.path = path
+        self.grids = grids
+        self.manifest = manifest
+        self.tables = {kind: np.load(os.path.join(path, info['file']), mmap_mode='r')
+                       for kind, info in manifest['tables'].items()}
+
+    def lookup(self, kind, teff, vmag, target, order_loc=None, tol=1e-3):
+        """
+        exposure time (s) for in-bounds 1-d arrays of teff, vmag and target;
+        targets beyond the reach of the grid are NaN
+        """
+        info = self.manifest['tables'][kind]
+        cube_name, decreasing = TABLES[kind]
+        table = self.tables[kind]
+        grids = self.grids
+        n_exp = len(grids.exptime_grid)
+        teff_map, vmag_map, _ = etc._index_maps(grids)
+        teff_index = teff_map(teff)
+        vmag_index = vmag_map(vmag)
+        goal = -np.asarray(target, dtype=np.double) if decreasing else np.asarray(target, dtype=np.double)
+        rows = np.zeros(len(teff), dtype=int) if order_loc is None else np.asarray(order_loc)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_target = np.log10(target)
+        cells = []
+        for values, axis in ((teff_index, self.manifest['teff_index']), (vmag_index, self.manifest['vmag_index']),
+                             (log_target, info['target'])):
+            coord = np.nan_to_num((values-axis['start'])/axis['step'])
+            cells.append(np.clip(np.round(coord), 0, axis['num']-1).astype(int))
+        upper = table[rows, cells[0], cells[1], cells[2]].astype(int)
+
+        def reached(node, which):
+            value = _node_values(grids, cube_name, node, vmag_index[which], teff_index[which],
+                                 None if order_loc is None else rows[which])
+            return (-value if decreasing else value)>=goal[which]
+
+        # the nodes are monotone, so moving one cell at a time towards the first
+        # reached node ends on it
+        for _ in range(n_exp):
+            which = np.flatnonzero(upper>0)
+            which = which[reached(upper[which]-1, which)]
+            if not len(which):
+                break
+            upper[which] -= 1
+        for _ in range(n_exp):
+            which = np.flatnonzero(upper<n_exp)
+            which = which[~reached(upper[which], which)]
+            if not len(which):
+                break
+            upper[which] += 1
+
+        # solve inside the bracketing cell as neid_etcalc_public._solve_nodes does
+        inside = np.flatnonzero((upper>0) & (upper<n_exp))
+        index = np.zeros(len(teff))
+        lower_value, upper_value = [
+            _node_values(grids, cube_name, node, vmag_index[inside], teff_index[inside],
+                         None if order_loc is None else rows[inside]) for node in (upper[inside]-1, upper[inside])]
+        if decreasing:
+            lower_value, upper_value = -lower_value, -upper_value
+        with np.errstate(divide='ignore', invalid='ignore'):
+            index[inside] = upper[inside]-1+(goal[inside]-lower_value)/(upper_value-lower_value)
+        exptime = etc._exptime_from_index(grids, index, tol)
+        return np.where(upper<n_exp, exptime, np.nan)
+
+
+def load_tables(path=None):
+    """
+    return the process-wide InverseTables, memory-mapping them on first use
+    path:          build directory (default: table_path())
+    """
+    global _tables
+    grids = grid_store.get_store()
+    path = path or table_path(grids)
+    with _lock:
+        if _tables is None or _tables.path!=path or _tables.grids is not grids:
+            if not os.path.exists(os.path.join(path, 'manifest.json')):
+                raise IOError('no inverse tables in %s; run python -m neid_calculator.inverse_tables build'
+                              % path)
+            _tables = InverseTables(path, grids)
+        return _tables
+
+
+def validate(path=None, n_points=20000, seed=0):
+    """
+    compare table lookups with the root solver on random in-bounds targets and
+    return the maximum deviations per table; 'ok' is False when a lookup is off
+    by more than MAX_DEVIATION seconds or leaves a solvable target unanswered
+    """
+    grids = grid_store.get_store()
+    tables = load_tables(path)
+    rng = np.random.default_rng(seed)
+    teff = rng.uniform(grids.teff_grid[0], grids.teff_grid[-1], n_points)
+    vmag = rng.uniform(grids.vmag_grid[0], grids.vmag_grid[-1], n_points)
+    exptime = 10**rng.uniform(grids.logexp[0], grids.logexp[-1], n_points)
+
+    report = {}
+    for kind, (cube_name, decreasing) in TABLES.items():
+        cube = getattr(grids, cube_name)
+        order_loc = rng.integers(0, cube.shape[0], n_points) if cube.ndim==4 else None
+        # targets reachable inside the grid, so both methods have an answer
+        target, _ = etc._evaluate(grids, cube_name, teff, vmag, exptime, order_loc=order_loc)
+        solved, _ = etc._solve_exptime(grids, cube_name, teff, vmag, target, order_loc=order_loc,
+                                       decreasing=decreasing)
+        looked_up = tables.lookup(kind, teff, vmag, target, order_loc=order_loc)
+        valid = ~np.isnan(solved)
+        deviation = np.abs(looked_up-solved)[valid]
+        missing = int(np.count_nonzero(np.isnan(looked_up[valid])))
+        max_abs = float(np.nanmax(deviation)) if missing<len(deviation) else np.nan
+        report[kind] = {'points': int(np.count_nonzero(valid)), 'missing': missing, 'max_abs': max_abs,
+                        'max_rel': float(np.nanmax(deviation/solved[valid])),
+                        'ok': missing==0 and max_abs<=MAX_DEVIATION}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.inverse_tables',
+                                     description='build or validate the inverse exposure time tables')
+    parser.add_argument('command', choices=('build', 'validate'))
+    parser.add_argument('--output', help='table directory (build default: inverse_tables/ next to the grids; '
+                                         'validate default: NEID_INVERSE_TABLES or that directory)')
+    parser.add_argument('--teff-refine', type=int, default=2)
+    parser.add_argument('--vmag-refine', type=int, default=4)
+    parser.add_argument('--n-targets', type=int, default=96)
+    parser.add_argument('--points', type=int, default=20000, help='number of validation points')
+    args = parser.parse_args(argv)
+
+    if args.command=='build':
+        build(args.output, teff_refine=args.teff_refine, vmag_refine=args.vmag_refine,
+              n_targets=args.n_targets)
+        return 0
+    report = validate(args.output, n_points=args.points)
+    for kind, stats in report.items():
+        print('%-9s max |dt| = %.4g s  max |dt|/t = %.3g  (%d points, %d unanswered)  %s'
+              % (kind, stats['max_abs'], stats['max_rel'], stats['points'], stats['missing'],
+                 'ok' if stats['ok'] else 'FAILED (bound %g s)' % MAX_DEVIATION))
+    ok = all(stats['ok'] for stats in report.values())
+    print('OK' if ok else 'FAILED')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
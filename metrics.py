@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+
+"""
+lightweight per-process instrumentation for the calculator
+
+neid_etcalc_public records the time spent in each stage of a calculation (grid
+load, index map and interpolator setup, index mapping, interpolation) and counts
+solver iterations, out of bounds rejections and interpolated orders. calc_shell
+adds per-route latency histograms. the numbers are available as a dict from
+snapshot() and in the Prometheus text format from prometheus_text(), which
+calc_shell serves at /calc_shell/metrics.
+
+recording costs a couple of perf_counter calls and a lock per stage, so it is on
+by default; set NEID_METRICS=0 to turn it off. the metrics are per process, so
+every gunicorn worker reports its own.
+"""
+
+# upper bounds (s) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+enabled = os.environ.get('NEID_METRICS', '1')!='0'
+
+_lock = threading.Lock()
+_stage_seconds = {}
+_stage_calls = {}
+_counters = {}
+_histograms = {}
+
+
+class stage(object):
+    """
+    context manager adding the time spent inside it to a named stage
+
+        with metrics.stage('interpolation'):
+            ...
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            elapsed = time.perf_counter()-self.start
+            with _lock:
+                _stage_seconds[self.name] = _stage_seconds.get(self.name, 0.)+elapsed
+                _stage_calls[self.name] = _stage_calls.get(self.name, 0)+1
+        return False
+
+
+def count(name, n=1):
+    """
+    add n to a named counter
+    """
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0)+int(n)
+
+
+def observe(name, label, value):
+    """
+    record a latency (s) in the histogram of one label, e.g. a route
+    """
+    if not enabled:
+        return
+    with _lock:
+        histogram = _histograms.setdefault(name, {}).get(label)
+        if histogram is None:
+            histogram = _histograms[name][label] = {'buckets': [0]*len(LATENCY_BUCKETS), 'sum': 0., 'count': 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value<=bound:
+                histogram['buckets'][i] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def snapshot():
+    """
+    copy of every metric recorded in this process
+    stages:        {stage: {'seconds': total, 'calls': n}}
+    counters:      {name: value}
+    histograms:    {name: {label: {'buckets': per-bucket counts, 'sum', 'count'}}}
+    """
+    with _lock:
+        return {'stages': {name: {'seconds': _stage_seconds[name], 'calls': _stage_calls[name]}
+                           for name in _stage_seconds},
+                'counters': dict(_counters),
+                'histograms': {name: {label: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                                      for label, h in labels.items()}
+                               for name, labels in _histograms.items()},
+                'latency_buckets': list(LATENCY_BUCKETS)}
+
+
+def reset():
+    with _lock:
+        _stage_seconds.clear()
+        _stage_calls.clear()
+        _counters.clear()
+        _histograms.clear()
+
+
+def prometheus_text():
+    """
+    the snapshot in the Prometheus text exposition format
+    """
+    data = snapshot()
+    lines = ['# HELP neid_stage_seconds_total Time spent in each calculation stage.',
+             '# TYPE neid_stage_seconds_total counter']
+    for name, values in sorted(data['stages'].items()):
+        lines.append('neid_stage_seconds_total{stage="%s"} %r' % (name, values['seconds']))
+    lines += ['# HELP neid_stage_calls_total Number of times each calculation stage ran.',
+              '# TYPE neid_stage_calls_total counter']
+    for name, values in sorted(data['stages'].items()):
+        lines.append('neid_stage_calls_total{stage="%s"} %d' % (name, values['calls']))
+    for name, value in sorted(data['counters'].items()):
+        lines += ['# TYPE neid_%s_total counter' % name, 'neid_%s_total %d' % (name, value)]
+    for name, labels in sorted(data['histograms'].items()):
+        lines.append('# TYPE neid_%s histogram' % name)
+        for label, h in sorted(labels.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, h['buckets']):
+                cumulative += n
+                lines.append('neid_%s_bucket{route="%s",le="%r"} %d' % (name, label, bound, cumulative))
+            lines.append('neid_%s_bucket{route="%s",le="+Inf"} %d' % (name, label, h['count']))
+            lines.append('neid_%s_sum{route="%s"} %r' % (name, label, h['sum']))
+            lines.append('neid_%s_count{route="%s"} %d' % (name, label, h['count']))
+    return '\n'.join(lines)+'\n'
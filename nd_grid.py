@@ -0,0 +1,583 @@
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+import neid_calculator.grid_bundle as grid_bundle
+import neid_calculator.interpolation as interpolation
+import neid_calculator.metrics as metrics
+
+
+"""
+chunked N-dimensional model grids
+
+a chunked grid file holds model cubes over any number of named axes (e.g.
+order, logg, metallicity, exptime, vmag, teff), each cube cut into fixed-shape
+chunks. a chunk is read from the memory-mapped file only when an interpolation
+touches it, and read chunks are kept in a cache bounded in bytes (least
+recently used first out), so a worker holds only the slices it needs: with
+per-order chunks, NEID_SNR at one wavelength reads one order.
+
+axes are either interpolated (multilinear in the fractional grid index, as
+interpolation.Trilinear) or discrete (integer positions, like the order axis).
+along interpolated axes neighbouring chunks share one node, so every grid cell
+lies inside a single chunk and each point is interpolated from one chunk.
+
+layout (as grid_bundle):
+    8 bytes       magic b'NEIDNDGR'
+    uint32 (le)   format version
+    uint32 (le)   length of the manifest in bytes
+    manifest      UTF-8 JSON: axes (values, log, interpolate, default), small
+                  tables (wavelengths, softlimit), grid checksum, the FITS files
+                  it was built from, and per cube its axes, dtype, chunk shape
+                  and offset
+    chunks        per cube, in C order of the chunk grid, each a full chunk
+                  (edge chunks padded) in C order, aligned to ALIGNMENT bytes
+
+grid_store loads a directory's neid_grids.ndgrid when it has no bundle, or
+always with NEID_GRID_FORMAT=chunked. the cubes are then ChunkedCube objects,
+and the calculator functions interpolate them with ChunkedInterpolator; axes
+beyond order, exptime, vmag and teff are held at their default value.
+
+    python -m neid_calculator.nd_grid build [--chunk order=1] [--float32] [--output FILE]
+    python -m neid_calculator.nd_grid info [FILE]
+"""
+
+GRID_FILE = 'neid_grids.ndgrid'
+GRID_VERSION = 1
+MAGIC = b'NEIDNDGR'
+ALIGNMENT = grid_bundle.ALIGNMENT
+
+# cache size (bytes) of the chunks read from one grid file
+CACHE_BYTES = int(float(os.environ.get('NEID_CHUNK_CACHE_MB', 256))*2**20)
+
+# points spread over several chunks are gathered from one concatenated copy of
+# those chunks when it is at most this large (bytes), else chunk by chunk
+GATHER_BYTES = 16*2**20
+
+# axes the calculator functions index, in the order of interpolation.Trilinear
+CALCULATOR_AXES = ('exptime', 'vmag', 'teff')
+
+_HEADER = struct.Struct('<8sII')
+
+
+class Axis(object):
+    """
+    one named grid axis
+    name:          axis name
+    values:        axis values, increasing along interpolated axes
+    log:           interpolate in log10(value)
+    interpolate:   False for a discrete axis addressed by integer position (order)
+    default:       value used when a coordinate along this axis is not given
+    """
+
+    def __init__(self, name, values, log=False, interpolate=True, default=None):
+        self.name = name
+        self.values = np.asarray(values, dtype=np.double)
+        self.log = log
+        self.interpolate = interpolate
+        self.default = default
+        self.size = len(self.values)
+        self._map = None
+
+    def to_manifest(self):
+        return {'values': self.values.tolist(), 'log': self.log, 'interpolate': self.interpolate,
+                'default': self.default}
+
+    def index(self, values):
+        """
+        fractional grid index of axis values (exact integer position on a
+        discrete axis); NaN outside the axis
+        """
+        shape = np.shape(values)
+        values = np.asarray(values, dtype=np.double).reshape(-1)
+        return self._index(values).reshape(shape)
+
+    def _index(self, values):
+        if not self.interpolate:
+            sorter = np.argsort(self.values)
+            loc = sorter[np.clip(np.searchsorted(self.values, values, sorter=sorter), 0, self.size-1)]
+            return np.where(self.values[loc]==values, loc, np.nan)
+        inside = (values>=self.values[0]) & (values<=self.values[-1])
+        if self._map is None:
+            # the spline index map of the calculator needs four nodes
+            self._map = interpolation.AxisMap(self.values, log=self.log) if self.size>=4 else False
+        if self._map:
+            index = self._map(np.where(inside, values, self.values[0]))
+        else:
+            x = np.log10 if self.log else np.asarray
+            index = np.interp(x(np.where(inside, values, self.values[0])), x(self.values),
+                              np.arange(self.size, dtype=np.double))
+        return np.where(inside, index, np.nan)
+
+
+def _chunk_layout(axes, chunks):
+    """
+    node step between chunks and number of chunks along each axis; chunks along
+    interpolated axes overlap by one node
+    """
+    steps, counts = [], []
+    for axis, size in zip(axes, chunks):
+        if axis.interpolate:
+            if size<2:
+                raise ValueError('chunks along interpolated axis %s need at least 2 nodes' % axis.name)
+            step = size-1
+            counts.append(max(1, -(-(axis.size-1)//step)))
+        else:
+            step = size
+            counts.append(-(-axis.size//step))
+        steps.append(step)
+    return steps, counts
+
+
+class ChunkCache(object):
+    """
+    least recently used cache of chunk arrays, bounded by their total size in bytes
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._chunks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+        if chunk is not None:
+            metrics.count('chunk_hits')
+            return chunk
+        metrics.count('chunk_misses')
+        chunk = load()
+        with self._lock:
+            if key not in self._chunks:
+                self._chunks[key] = chunk
+                self.nbytes += chunk.nbytes
+            # always keep the newest chunk, even when it alone is over the limit
+            while self.nbytes>self.max_bytes and len(self._chunks)>1:
+                self.nbytes -= self._chunks.popitem(last=False)[1].nbytes
+        return chunk
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self.nbytes = 0
+
+
+def _multilinear(flat, base, fracs, offsets):
+    """
+    blend the 2**k corners of each cell, the last interpolated axis first (the
+    same operations as interpolation.Trilinear for k=3)
+    """
+    k = fracs.shape[1]
+    corners = np.take(flat, base[:, np.newaxis]+offsets).reshape((len(base),)+(2,)*k)
+    for axis in range(k-1, -1, -1):
+        frac = fracs[:, axis].reshape((len(base),)+(1,)*axis)
+        corners = corners[..., 0]+(corners[..., 1]-corners[..., 0])*frac
+    return corners
+
+
+class ChunkedCube(object):
+    """
+    read-only model cube whose chunks are read on demand
+    axes:          Axis of each dimension
+    shape:         grid shape
+    chunks:        chunk shape
+    dtype:         storage dtype (chunks are converted to float64 when read)
+    """
+
+    def __init__(self, name, axes, raw, info, cache):
+        self.name = name
+        self.axes = axes
+        self.axis_names = tuple(axis.name for axis in axes)
+        self.shape = tuple(axis.size for axis in axes)
+        self.ndim = len(self.shape)
+        self.chunks = tuple(info['chunks'])
+        self.dtype = np.dtype(info['dtype'])
+        self.steps, self.chunk_grid = _chunk_layout(axes, self.chunks)
+        self.chunk_size = int(np.prod(self.chunks))
+        self._offset = info['offset']
+        self._raw = raw
+        self._cache = cache
+        self._interpolated = np.array([axis.interpolate for axis in axes])
+        self._strides = np.cumprod((1,)+self.chunks[::-1][:-1])[::-1].astype(np.intp)
+        corners = np.array(list(itertools.product((0, 1), repeat=int(self._interpolated.sum()))), dtype=np.intp)
+        self._offsets = corners.reshape(-1, self._interpolated.sum())@self._strides[self._interpolated]
+
+    def chunk(self, number):
+        """
+        chunk number (C order of the chunk grid) as a float64 array of the chunk shape
+        """
+        def load():
+            size = self.chunk_size*self.dtype.itemsize
+            start = self._offset+number*grid_bundle._align(size)
+            data = self._raw[start:start+size].view(self.dtype).reshape(self.chunks)
+            chunk = np.array(data, dtype=np.double)
+            chunk.flags.writeable = False
+            return chunk
+        return self._cache.get((self.name, number), load)
+
+    def interpolate(self, positions):
+        """
+        values at grid positions
+        positions:     array (n, ndim): fractional indices along interpolated axes,
+                       integer positions along discrete axes, all inside the grid
+        """
+        positions = np.asarray(positions, dtype=np.double)
+        n = len(positions)
+        fracs = np.empty((n, int(self._interpolated.sum())))
+        number = np.zeros(n, dtype=np.intp)
+        base = np.zeros(n, dtype=np.intp)
+        k = 0
+        for a, axis in enumerate(self.axes):
+            if axis.interpolate:
+                cell = np.minimum(positions[:, a].astype(np.intp), axis.size-2)
+                fracs[:, k] = positions[:, a]-cell
+                k += 1
+                chunk = np.minimum(cell//self.steps[a], self.chunk_grid[a]-1)
+            else:
+                cell = positions[:, a].astype(np.intp)
+                chunk = cell//self.steps[a]
+            number = number*self.chunk_grid[a]+chunk
+            base += (cell-chunk*self.steps[a])*self._strides[a]
+
+        values = np.empty(n)
+        if n==0:
+            return values
+        if number.min()==number.max():
+            values[:] = _multilinear(self.chunk(int(number[0])).reshape(-1), base, fracs, self._offsets)
+            return values
+        used, inverse = np.unique(number, return_inverse=True)
+        if len(used)*self.chunk_size*8<=GATHER_BYTES:
+            flat = np.concatenate([self.chunk(int(c)).reshape(-1) for c in used])
+            values[:] = _multilinear(flat, base+inverse*self.chunk_size, fracs, self._offsets)
+            return values
+        order = np.argsort(number, kind='stable')
+        ends = np.flatnonzero(np.diff(number[order]))+1
+        for group in np.split(order, ends):
+            flat = self.chunk(int(number[group[0]])).reshape(-1)
+            values[group] = _multilinear(flat, base[group], fracs[group], self._offsets)
+        return values
+
+    def __getitem__(self, key):
+        """
+        basic indexing (integers and slices) reads only the chunks it covers
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i]+(slice(None),)*(self.ndim-len(key)+1)+key[i+1:]
+        key = key+(slice(None),)*(self.ndim-len(key))
+        ranges, picks, squeeze = [], [], []
+        for a, k in enumerate(key):
+            if isinstance(k, slice):
+                nodes = np.arange(*k.indices(self.shape[a]))
+            else:
+                k = int(k)+self.shape[a] if int(k)<0 else int(k)
+                if not 0<=k<self.shape[a]:
+                    raise IndexError('index %d is out of bounds for axis %d with size %d' % (k, a, self.shape[a]))
+                nodes = np.array([k])
+                squeeze.append(a)
+            start = int(nodes.min()) if len(nodes) else 0
+            ranges.append((start, int(nodes.max())+1 if len(nodes) else 0))
+            picks.append(nodes-start)
+        out = np.empty([stop-start for start, stop in ranges])
+        # every node is read from the chunk that owns it; the shared node at a
+        # chunk boundary is owned by the later chunk
+        spans = []
+        for a, (start, stop) in enumerate(ranges):
+            step = self.steps[a]
+            first = min(start//step, self.chunk_grid[a]-1)
+            last = min(max(stop-1, start)//step, self.chunk_grid[a]-1)
+            spans.append([(c, max(start, c*step), stop if c==self.chunk_grid[a]-1 else min(stop, (c+1)*step))
+                          for c in range(first, last+1)])
+        for parts in itertools.product(*spans):
+            number = 0
+            for a, (c, _, _) in enumerate(parts):
+                number = number*self.chunk_grid[a]+c
+            source = tuple(slice(lo-c*self.steps[a], hi-c*self.steps[a]) for a, (c, lo, hi) in enumerate(parts))
+            target = tuple(slice(lo-ranges[a][0], hi-ranges[a][0]) for a, (c, lo, hi) in enumerate(parts))
+            out[target] = self.chunk(number)[source]
+        if any(len(p)!=stop-start or np.any(np.diff(p)!=1) for p, (start, stop) in zip(picks, ranges)):
+            out = out[np.ix_(*picks)]
+        return out.squeeze(axis=tuple(squeeze)) if squeeze else out
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+
+class ChunkedInterpolator(object):
+    """
+    drop-in for interpolation.Trilinear over a ChunkedCube: takes fractional
+    (exptime, vmag, teff) indices and optional order positions, and holds every
+    other axis at its default value
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        self.shape = cube.shape
+        names = cube.axis_names
+        self._columns = [names.index(name) for name in CALCULATOR_AXES]
+        self._order = names.index('order') if 'order' in names else None
+        self._fixed = []
+        for a, axis in enumerate(cube.axes):
+            if axis.name in CALCULATOR_AXES or axis.name=='order':
+                continue
+            if axis.default is None:
+                raise ValueError('axis %s of %s has no default value' % (axis.name, cube.name))
+            position = axis.index(axis.default)
+            if np.isnan(position):
+                raise ValueError('default %s of axis %s is not in the grid' % (axis.default, axis.name))
+            self._fixed.append((a, float(position)))
+
+    def __call__(self, indices, order=None, out=None):
+        indices = np.asarray(indices, dtype=np.double)
+        shape = indices.shape[:-1]
+        if order is not None:
+            order = np.asarray(order, dtype=np.intp)
+            shape = np.broadcast_shapes(shape, order.shape)
+        elif self._order is not None:
+            raise ValueError('a per-order cube needs order positions')
+        positions = np.empty(shape+(self.cube.ndim,))
+        positions[..., self._columns] = indices
+        if self._order is not None:
+            positions[..., self._order] = order
+        for a, position in self._fixed:
+            positions[..., a] = position
+        values = self.cube.interpolate(positions.reshape(-1, self.cube.ndim)).reshape(shape)
+        if out is None:
+            return values
+        out[...] = values
+        return out
+
+
+def write(output, axes, cubes, tables=None, chunks=None, cube_dtype='<f8', grid_checksum=None, sources=None):
+    """
+    write a chunked grid file
+    axes:          list of Axis
+    cubes:         dict of name: (axis names, array); the arrays may be memory-mapped,
+                   they are read one chunk at a time
+    tables:        dict of small arrays stored in the manifest (wavelengths, softlimit)
+    chunks:        dict of name: chunk shape; by default one chunk per position
+                   along discrete axes and whole interpolated axes
+    cube_dtype:    '<f8' or '<f4'
+    grid_checksum: checksum recorded in the manifest (default: sha256 of the axes
+                   and cubes)
+    sources:       size and sha256 of the files the grid was built from (see
+                   grid_store.source_files)
+    """
+    axes = collections.OrderedDict((axis.name, axis) for axis in axes)
+    chunks = chunks or {}
+    dtype = np.dtype(cube_dtype)
+    manifest = {'version': GRID_VERSION,
+                'axes': collections.OrderedDict((name, axis.to_manifest()) for name, axis in axes.items()),
+                'tables': {name: np.asarray(values).tolist() for name, values in (tables or {}).items()},
+                'sources': sources or {},
+                'cubes': collections.OrderedDict()}
+
+    offset = 0
+    layout = []
+    for name, (names, data) in cubes.items():
+        cube_axes = [axes[axis] for axis in names]
+        if tuple(data.shape)!=tuple(axis.size for axis in cube_axes):
+            raise ValueError('%s has shape %s, its axes %s' % (name, data.shape, names))
+        shape = tuple(chunks.get(name) or [axis.size if axis.interpolate else 1 for axis in cube_axes])
+        steps, counts = _chunk_layout(cube_axes, shape)
+        manifest['cubes'][name] = {'axes': list(names), 'dtype': dtype.str, 'chunks': list(shape),
+                                   'offset': offset}
+        layout.append((name, data, shape, steps, counts))
+        offset += int(np.prod(counts))*grid_bundle._align(int(np.prod(shape))*dtype.itemsize)
+
+    digest = hashlib.sha256()
+    tmp = output+'.tmp'
+    with open(tmp, 'wb') as f:
+        # the manifest is written last, once the checksum is known; reserve room
+        # for it by writing a first version with a placeholder checksum
+        manifest['grid_checksum'] = grid_checksum or '0'*64
+        text = json.dumps(manifest).encode('utf-8')
+        start = grid_bundle._align(_HEADER.size+len(text))
+        for name, data, shape, steps, counts in layout:
+            size = grid_bundle._align(int(np.prod(shape))*dtype.itemsize)
+            for number, chunk in enumerate(itertools.product(*[range(c) for c in counts])):
+                region = tuple(slice(c*s, c*s+n) for c, s, n in zip(chunk, steps, shape))
+                block = np.zeros(shape, dtype=dtype)
+                values = np.asarray(data[region])
+                block[tuple(slice(0, n) for n in values.shape)] = values
+                digest.update(block.tobytes())
+                f.seek(start+manifest['cubes'][name]['offset']+number*size)
+                f.write(block.tobytes())
+        f.truncate(start+offset)
+        for axis in axes.values():
+            digest.update(axis.values.astype('<f8').tobytes())
+        manifest['grid_checksum'] = grid_checksum or digest.hexdigest()
+        text = json.dumps(manifest).encode('utf-8')
+        if grid_bundle._align(_HEADER.size+len(text))!=start:
+            raise RuntimeError('manifest size changed while writing %s' % output)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, GRID_VERSION, len(text)))
+        f.write(text)
+    os.replace(tmp, output)
+    return output
+
+
+def read_manifest(path):
+    """
+    manifest of a chunked grid file and the file offset of its chunk section
+    """
+    with open(path, 'rb') as f:
+        magic, version, length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic!=MAGIC:
+            raise ValueError('%s is not a chunked NEID grid' % path)
+        if version!=GRID_VERSION:
+            raise ValueError('%s has grid version %d, expected %d' % (path, version, GRID_VERSION))
+        manifest = json.loads(f.read(length).decode('utf-8'), object_pairs_hook=collections.OrderedDict)
+    return manifest, grid_bundle._align(_HEADER.size+length)
+
+
+class NDGrid(object):
+    """
+    a chunked grid file, memory-mapped
+    path:          grid file
+    cache_bytes:   size limit of the chunk cache
+
+    axes:          dict of name: Axis
+    tables:        dict of the small arrays stored with the grid
+    cubes:         dict of name: ChunkedCube
+    """
+
+    def __init__(self, path, cache_bytes=CACHE_BYTES):
+        self.path = path
+        self.manifest, start = read_manifest(path)
+        self.cache = ChunkCache(cache_bytes)
+        self.axes = collections.OrderedDict(
+            (name, Axis(name, info['values'], log=info['log'], interpolate=info['interpolate'],
+                        default=info['default']))
+            for name, info in self.manifest['axes'].items())
+        self.tables = {name: np.array(values, dtype=np.double) for name, values in self.manifest['tables'].items()}
+        raw = np.memmap(path, dtype=np.uint8, mode='r')[start:]
+        self.cubes = collections.OrderedDict(
+            (name, ChunkedCube(name, [self.axes[axis] for axis in info['axes']], raw, info, self.cache))
+            for name, info in self.manifest['cubes'].items())
+
+    def interpolate(self, name, **coordinates):
+        """
+        interpolate a cube at axis values, e.g.
+            grid.interpolate('snr_grid_order', order=100, exptime=300., vmag=8., teff=5000., logg=4.)
+        axes that are not given take their default; the coordinates broadcast
+        against each other, and points outside the grid (or between the values
+        of a discrete axis) are NaN
+        """
+        cube = self.cubes[name]
+        unknown = set(coordinates)-set(cube.axis_names)
+        if unknown:
+            raise ValueError('%s has no axis %s' % (name, ', '.join(sorted(unknown))))
+        values = []
+        for axis in cube.axes:
+            value = coordinates.get(axis.name, axis.default)
+            if value is None:
+                raise ValueError('no value for axis %s, which has no default' % axis.name)
+            values.append(value)
+        values = np.broadcast_arrays(*[np.asarray(v, dtype=np.double) for v in values])
+        positions = np.stack([axis.index(v) for axis, v in zip(cube.axes, values)], axis=-1)
+        inside = ~np.any(np.isnan(positions), axis=-1)
+        result = np.full(inside.shape, np.nan)
+        result[inside] = cube.interpolate(positions[inside])
+        return result[()]
+
+    def store_arrays(self):
+        """
+        the arrays of a GridStore: axis grids and tables as arrays, cubes as ChunkedCube
+        """
+        data = {'exptime_grid': self.axes['exptime'].values,
+                'teff_grid': self.axes['teff'].values,
+                'vmag_grid': self.axes['vmag'].values,
+                'order_grid': self.axes['order'].values,
+                'wavelength_grid': self.tables['wavelengths'],
+                'softlimit': self.tables['softlimit']}
+        for name in grid_bundle.CUBES:
+            data[name] = self.cubes[name]
+        return data
+
+
+def build(source=None, output=None, chunks=None, float32=False):
+    """
+    write the grids of a grid store directory as a chunked grid file
+    source:        directory holding the grids (default: the grid store path)
+    output:        grid file (default: GRID_FILE in the source directory)
+    chunks:        dict of axis name: chunk length, applied to every cube with
+                   that axis (default: one order per chunk, whole other axes)
+    float32:       store the cubes as float32; the grid checksum is then that of
+                   the stored cubes rather than of the FITS grids
+    """
+    import neid_calculator.grid_store as grid_store
+
+    source = source or grid_store.default_path()
+    output = output or os.path.join(source, GRID_FILE)
+    grids = grid_store.GridStore(source)
+    axes = [Axis('order', grids.order_grid, interpolate=False),
+            Axis('exptime', grids.exptime_grid, log=True),
+            Axis('vmag', grids.vmag_grid),
+            Axis('teff', grids.teff_grid)]
+    cubes = collections.OrderedDict()
+    cubes['rvprec_grid'] = (('exptime', 'vmag', 'teff'), grids.rvprec_grid)
+    cubes['rvprec_grid_order'] = (('order', 'exptime', 'vmag', 'teff'), grids.rvprec_grid_order)
+    cubes['snr_grid_order'] = (('order', 'exptime', 'vmag', 'teff'), grids.snr_grid_order)
+    shapes = {}
+    for name, (names, _) in cubes.items():
+        shapes[name] = [(chunks or {}).get(axis, 1 if axis=='order' else size)
+                        for axis, size in zip(names, cubes[name][1].shape)]
+    return write(output, axes, cubes, tables={'wavelengths': grids.wavelength_grid,
+                                              'softlimit': grids.softlimit},
+                 # rounded float32 cubes must not claim the identity of the exact grids
+                 chunks=shapes, cube_dtype='<f4' if float32 else '<f8',
+                 grid_checksum=None if float32 else grids.checksum(),
+                 sources=grid_store.source_files(source))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m neid_calculator.nd_grid',
+                                     description='build or describe a chunked grid file')
+    parser.add_argument('command', choices=('build', 'info'))
+    parser.add_argument('file', nargs='?', help='grid file to describe')
+    parser.add_argument('--source', help='directory holding the grids to convert')
+    parser.add_argument('--output', help='grid file to write')
+    parser.add_argument('--chunk', action='append', default=[], metavar='AXIS=LENGTH',
+                        help='chunk length along an axis (repeatable), e.g. order=1 teff=8')
+    parser.add_argument('--float32', action='store_true', help='store the cubes as float32')
+    args = parser.parse_args(argv)
+
+    if args.command=='build':
+        chunks = {}
+        for item in args.chunk:
+            axis, _, length = item.partition('=')
+            chunks[axis] = int(length)
+        output = build(args.source, args.output, chunks, args.float32)
+        print('%s written (%d bytes)' % (output, os.path.getsize(output)))
+        return 0
+    import neid_calculator.grid_store as grid_store
+    grid = NDGrid(args.file or os.path.join(grid_store.default_path(), GRID_FILE))
+    for axis in grid.axes.values():
+        print('%-10s %4d values  %g .. %g%s%s' % (axis.name, axis.size, axis.values[0], axis.values[-1],
+                                                 '' if axis.interpolate else '  discrete',
+                                                 '' if axis.default is None else '  default %g' % axis.default))
+    for name, cube in grid.cubes.items():
+        print('%-18s %s  chunks %s  (%d of %d bytes)  %s' % (
+            name, 'x'.join(map(str, cube.shape)), 'x'.join(map(str, cube.chunks)),
+            cube.chunk_size*cube.dtype.itemsize, int(np.prod(cube.shape))*cube.dtype.itemsize,
+            ', '.join(cube.axis_names)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
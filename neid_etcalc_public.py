@@ -1,301 +1,463 @@
-from astropy.io import fits
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline, RegularGridInterpolator
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.interpolation as interpolation
+import neid_calculator.metrics as metrics
+import neid_calculator.nd_grid as nd_grid
 
 
 """
-the path_to_grid variable must be set to the filepath for the directory in which
-the grids are stored such that the exposure time functions can find these files
+the grids are loaded once per process by neid_calculator.grid_store. they are
+read from the package directory unless the NEID_GRID_PATH environment variable
+is set or grid_store.configure() is called with the directory holding them
 
-ex: path_to_grid = '/home/anaconda3/lib/python3.6/site-packages/neid_calculator/'
+ex: grid_store.configure('/home/anaconda3/lib/python3.6/site-packages/neid_calculator/')
 """
 
-path_to_grid='/home/afgupta/neid_flask/neid_calculator/'
+def _index_maps(grids):
+    """
+    maps of teff, vmag and exptime onto fractional grid indices
+    (see neid_calculator.interpolation.AxisMap)
+    """
+    def build():
+        with metrics.stage('index_map_setup'):
+            return (interpolation.AxisMap(grids.teff_grid),
+                    interpolation.AxisMap(grids.vmag_grid),
+                    interpolation.AxisMap(grids.exptime_grid, log=True))
+    return grids.cached('index_maps', build)
+
+def _interpolator(grids, name):
+    """
+    trilinear interpolator over grid indices for one of the model cubes;
+    the per-order cubes take integer order positions as well
+    """
+    def build():
+        cube=getattr(grids, name)
+        with metrics.stage('interpolator_setup'):
+            if isinstance(cube, nd_grid.ChunkedCube):
+                return nd_grid.ChunkedInterpolator(cube)
+            return interpolation.Trilinear(cube)
+    return grids.cached(name+'_interpolator', build)
+
+def _in_bounds(grids, teff, vmag, exptime=None, verbose=False):
+    """
+    boolean mask of the inputs that lie inside the model grids; with verbose=True
+    the allowed range is printed for each axis that has out of bounds entries
+    """
+    teff_grid, vmag_grid, exptime_grid = grids.teff_grid, grids.vmag_grid, grids.exptime_grid
+    teff_ok=(teff>=teff_grid[0]) & (teff<=teff_grid[-1])
+    vmag_ok=(vmag>=vmag_grid[0]) & (vmag<=vmag_grid[-1])
+    mask=teff_ok & vmag_ok
+    if exptime is not None:
+        exptime_ok=(exptime>=exptime_grid[0]) & (exptime<=exptime_grid[-1])
+        mask=mask & exptime_ok
+    if verbose:
+        if not np.all(teff_ok):
+            print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
+        if not np.all(vmag_ok):
+            print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
+        if exptime is not None and not np.all(exptime_ok):
+            print("Exposure time out of bounds. The allowed range is %d s to %d s." % (np.min(exptime_grid), np.max(exptime_grid)))
+    metrics.count('out_of_bounds', np.size(mask)-np.count_nonzero(mask))
+    return mask
+
+def _grid_indices(grids, teff, vmag, exptime):
+    """
+    fractional (exptime, vmag, teff) grid indices for in-bounds inputs
+    """
+    teff_map, vmag_map, exptime_map = _index_maps(grids)
+    with metrics.stage('index_mapping'):
+        indices=np.empty(teff.shape+(3,))
+        exptime_map(exptime, out=indices[...,0])
+        vmag_map(vmag, out=indices[...,1])
+        teff_map(teff, out=indices[...,2])
+    return indices
+
+def _order_index(grids, order):
+    """
+    position of each order number in the per-order cubes
+    """
+    order=np.asarray(order)
+    loc=np.searchsorted(-grids.order_grid, -order)
+    loc=np.minimum(loc, len(grids.order_grid)-1)
+    if not np.all(grids.order_grid[loc]==order):
+        raise IndexError('order not in the model grid')
+    return loc
+
+def _wavelength_match(grids, wavelength):
+    """
+    position of the nearest order center to each wavelength and whether it lies
+    within 0.1 nm of it
+    """
+    wavelength=np.asarray(wavelength, dtype=np.double)
+    wavelength_grid=grids.wavelength_grid
+    loc=np.clip(np.searchsorted(wavelength_grid, wavelength), 1, len(wavelength_grid)-1)
+    lower=wavelength-wavelength_grid[loc-1] < wavelength_grid[loc]-wavelength
+    loc=np.where(lower, loc-1, loc)
+    return loc, np.abs(wavelength_grid[loc]-wavelength)<0.1
+
+def _wavelength_index(grids, wavelength):
+    """
+    position of the order centered within 0.1 nm of each wavelength
+    """
+    loc, matched = _wavelength_match(grids, wavelength)
+    if not np.all(matched):
+        raise IndexError('wavelength does not match an order center')
+    return loc
 
-def NEID_RV_prec(teff, vmag, exptime, use_order=False, order=0):
+def _evaluate(grids, name, teff, vmag, exptime, order_loc=None, verbose=False):
+    """
+    interpolate one of the model cubes at every (teff, vmag, exptime[, order])
+    point in a single batched call; out of bounds points are NaN
+    returns the values and the in-bounds mask
+    """
+    arrays=[teff, vmag, exptime] if order_loc is None else [teff, vmag, exptime, order_loc]
+    arrays=np.broadcast_arrays(*[np.asarray(a, dtype=np.double) for a in arrays])
+    teff, vmag, exptime = arrays[:3]
+    mask=_in_bounds(grids, teff, vmag, exptime, verbose=verbose)
+    values=np.full(mask.shape, np.nan)
+    if np.any(mask):
+        indices=_grid_indices(grids, teff[mask], vmag[mask], exptime[mask])
+        order=None if order_loc is None else arrays[3][mask].astype(int)
+        interpolator=_interpolator(grids, name)
+        with metrics.stage('interpolation'):
+            values[mask]=interpolator(indices, order)
+    return values, mask
+
+def _evaluate_orders(grids, name, teff, vmag, exptime, verbose=False):
+    """
+    interpolate a per-order cube for every order at every (teff, vmag, exptime)
+    point in one pass; returns values of shape (..., n_orders) and the in-bounds mask
+    """
+    teff, vmag, exptime = np.broadcast_arrays(*[np.asarray(a, dtype=np.double) for a in (teff, vmag, exptime)])
+    mask=_in_bounds(grids, teff, vmag, exptime, verbose=verbose)
+    n_order=len(grids.order_grid)
+    values=np.full(mask.shape+(n_order,), np.nan)
+    if np.any(mask):
+        indices=_grid_indices(grids, teff[mask], vmag[mask], exptime[mask])
+        interpolator=_interpolator(grids, name)
+        with metrics.stage('interpolation'):
+            values[mask]=interpolator(indices[:,np.newaxis,:], np.arange(n_order))
+        metrics.count('orders_interpolated', np.count_nonzero(mask)*n_order)
+    return values, mask
+
+def _result(values, mask, return_mask):
+    if values.ndim==0:
+        values, mask = values[()], bool(mask)
+    if return_mask:
+        return values, mask
+    return values
+
+def _exptime_nodes(grids, name, teff, vmag, order_loc=None):
+    """
+    interpolate a model cube in teff and vmag at every node of the exptime axis;
+    returns an array of shape (npoints, len(exptime_grid))
+    """
+    teff_map, vmag_map, _ = _index_maps(grids)
+    n_exp = len(grids.exptime_grid)
+    with metrics.stage('index_mapping'):
+        indices=np.empty((len(teff), n_exp, 3))
+        indices[...,0]=np.arange(n_exp)
+        indices[...,1]=vmag_map(vmag)[:,np.newaxis]
+        indices[...,2]=teff_map(teff)[:,np.newaxis]
+    order=None if order_loc is None else order_loc[:,np.newaxis]
+    interpolator=_interpolator(grids, name)
+    with metrics.stage('interpolation'):
+        return interpolator(indices, order)
+
+def _node_value(grids, nodes, exptime):
+    """
+    value of the node curves at the given exposure times; the interpolation is
+    linear in the fractional exptime index, exactly as in the full cube
+    """
+    exptime_map = _index_maps(grids)[2]
+    index=exptime_map(exptime)
+    cell=np.minimum(index.astype(int), nodes.shape[1]-2)
+    rows=np.arange(len(nodes))
+    frac=index-cell
+    return nodes[rows,cell]*(1-frac)+nodes[rows,cell+1]*frac
+
+def _exptime_from_index(grids, index, tol):
+    """
+    invert the log-exptime index map; returns exposure times within tol seconds
+    """
+    with metrics.stage('solver'):
+        exptime=_index_maps(grids)[2].inverse(index, tol)
+    metrics.count('solver_targets', len(index))
+    return exptime
+
+def _quantize_exptime(grids, nodes, goal, exptime):
+    """
+    round continuous solutions onto the 2 s steps (starting at 12 s) used by the
+    original linear scan, returning the first step that reaches the goal
+    """
+    step=np.maximum(12., 2*np.ceil(exptime/2))
+    earlier=np.maximum(12., step-2)
+    step=np.where(_node_value(grids, nodes, earlier)>=goal, earlier, step)
+    later=np.minimum(step+2, grids.exptime_grid[-1])
+    step=np.where(_node_value(grids, nodes, step)>=goal, step, later)
+    return step
+
+def _solve_nodes(grids, nodes, goal, decreasing=False, tol=1e-3, quantize=False):
+    """
+    exposure time at which each node curve (see _exptime_nodes) reaches its goal;
+    NaN where it does not within the grid
+    """
+    if decreasing:
+        nodes, goal = -nodes, -goal
+    reached=nodes>=goal[:,np.newaxis]
+    rows=np.arange(len(goal))
+    upper=np.argmax(reached, axis=1)
+    found=reached[rows,upper]
+    lower=np.maximum(upper-1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac=(goal-nodes[rows,lower])/(nodes[rows,upper]-nodes[rows,lower])
+    index=np.where(upper==0, 0., lower+frac)
+    solution=_exptime_from_index(grids, index, tol)
+    if quantize:
+        solution, found = _quantize_solution(grids, nodes, goal, solution, found)
+    return np.where(found, solution, np.nan)
+
+def _quantize_solution(grids, nodes, goal, solution, found):
+    """
+    quantize solutions (see _quantize_exptime) of the (sign adjusted) node curves;
+    a solution is kept only when its step reaches the goal
+    """
+    solution=_quantize_exptime(grids, nodes, goal, np.where(found, solution, grids.exptime_grid[0]))
+    return solution, found & (_node_value(grids, nodes, solution)>=goal)
+
+def _solve_exptime(grids, name, teff, vmag, target, order_loc=None, decreasing=False,
+                   tol=1e-3, quantize=False, lookup=False, verbose=False):
+    """
+    exposure time at which an interpolated model cube reaches target
+
+    the cube is monotone along the exptime axis, so the solution is bracketed
+    between the two exptime nodes whose values straddle the target. inside the
+    bracket the interpolant is linear in the fractional index, which is solved
+    directly and mapped back to seconds by inverting the index map.
+    returns the exposure times (NaN when out of bounds or beyond the grid) and
+    the in-bounds mask. with lookup=True the bracketing exptime cell is read
+    from the prebuilt inverse tables instead of searched for (see
+    neid_calculator.inverse_tables); the answer is the same
+    """
+    arrays=[teff, vmag, target] if order_loc is None else [teff, vmag, target, order_loc]
+    arrays=np.broadcast_arrays(*[np.asarray(a, dtype=np.double) for a in arrays])
+    teff, vmag, target = arrays[:3]
+    mask=_in_bounds(grids, teff, vmag, verbose=verbose)
+    exptime=np.full(mask.shape, np.nan)
+    if np.any(mask) and lookup:
+        import neid_calculator.inverse_tables as inverse_tables
+        kind=[k for k, (cube, _) in inverse_tables.TABLES.items() if cube==name][0]
+        order=None if order_loc is None else arrays[3][mask].astype(int)
+        solution=inverse_tables.load_tables().lookup(kind, teff[mask], vmag[mask], target[mask], order, tol=tol)
+        if quantize:
+            # the 2 s steps are checked against the whole node curve, as in the solver
+            nodes=_exptime_nodes(grids, name, teff[mask], vmag[mask], order)
+            goal=target[mask]
+            if decreasing:
+                nodes, goal = -nodes, -goal
+            solution, found = _quantize_solution(grids, nodes, goal, solution, ~np.isnan(solution))
+            solution=np.where(found, solution, np.nan)
+        exptime[mask]=solution
+    elif np.any(mask):
+        order=None if order_loc is None else arrays[3][mask].astype(int)
+        nodes=_exptime_nodes(grids, name, teff[mask], vmag[mask], order)
+        exptime[mask]=_solve_nodes(grids, nodes, target[mask], decreasing=decreasing,
+                                   tol=tol, quantize=quantize)
+    if verbose and mask.all() and np.isnan(exptime).all():
+        print("\nMaximum Exposure Time Exceeded (t>3600s).\n")
+    return exptime, mask
+
+def warm_up():
+    """
+    load the grid store and build every index map and interpolator, so a server
+    can do this once before forking its workers
+    """
+    grids = grid_store.get_store()
+    _index_maps(grids)
+    for name in ('rvprec_grid', 'rvprec_grid_order', 'snr_grid_order'):
+        _interpolator(grids, name)
+        # fault the memory-mapped cube into the page cache shared by the workers;
+        # chunked cubes are left to be read as they are needed
+        if not isinstance(getattr(grids, name), nd_grid.ChunkedCube):
+            np.sum(getattr(grids, name))
+    NEID_max_exptime(grids.teff_grid[0], grids.vmag_grid[0])
+    return grids
+
+def NEID_RV_prec(teff, vmag, exptime, use_order=False, order=0, return_mask=False):
     """
     calculate expected RV precision in cm/s for the given inputs
     teff:          Effective Temperature (K)
     vmag:          V-band magnitude
     exptime:       Exposure time (s)
     set use_order=True to calculate RV precision for a specific order
+
+    inputs may be scalars or broadcastable arrays; every point is evaluated in one
+    interpolator call. out of bounds points are NaN, and with return_mask=True the
+    boolean in-bounds mask is returned as well
     """
 
-    exptime_grid = fits.open(path_to_grid+'photon_grid_exptime.fits')[0].data
-    teff_grid = fits.open(path_to_grid+'photon_grid_teff.fits')[0].data
-    vmag_grid = fits.open(path_to_grid+'photon_grid_vmag.fits')[0].data
-    logexp=np.log10(exptime_grid)
-    
-    bound_test=True
-    if teff<np.min(teff_grid) or teff>np.max(teff_grid):
-        print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
-        bound_test=False
-    if vmag<np.min(vmag_grid) or vmag>np.max(vmag_grid):
-        print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
-        bound_test=False
-    if exptime<np.min(exptime_grid) or exptime>np.max(exptime_grid):
-        print("Exposure time out of bounds. The allowed range is %d s to %d s." % (np.min(exptime_grid), np.max(exptime_grid)))
-        bound_test=False
-    if bound_test==False:
-        return np.nan
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(exptime)==0
 
-    
     if use_order==True:
-        order_grid = fits.open(path_to_grid+'order_wvl_centers.fits')[0].data[0]
-        order_loc=np.where(order_grid==order)[0][0]
-        rvprec_grid_order = fits.open(path_to_grid+'dv_uncertainty_master_order.fits')[0].data
-        rvprec_grid=rvprec_grid_order[order_loc]
+        values, mask = _evaluate(grids, 'rvprec_grid_order', teff, vmag, exptime,
+                                 order_loc=_order_index(grids, order), verbose=verbose)
     else:
-        rvprec_grid = fits.open(path_to_grid+'dv_uncertainty_master.fits')[0].data
-    
-    
-    teff_index=InterpolatedUnivariateSpline(teff_grid, 
-                            np.arange(len(teff_grid), dtype=np.double))(teff)
+        values, mask = _evaluate(grids, 'rvprec_grid', teff, vmag, exptime, verbose=verbose)
 
-    vmag_index=InterpolatedUnivariateSpline(vmag_grid, 
-                            np.arange(len(vmag_grid), dtype=np.double))(vmag)
-    exptime_index=InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),
-                                                dtype=np.double))(np.log10(exptime))
-    rvprec_interpolator=RegularGridInterpolator((np.arange(len(exptime_grid)),
-                          np.arange(len(vmag_grid)),
-                          np.arange(len(teff_grid))),
-                                rvprec_grid)
-    inputs=[exptime_index, vmag_index, teff_index]
-    rv_precision=rvprec_interpolator(inputs)[0]
+    return _result(values, mask, return_mask)
 
-    return rv_precision
 
-def NEID_exptime_RV(teff, vmag, rv_precision,use_order=False, order=0):
+def NEID_exptime_RV(teff, vmag, rv_precision, use_order=False, order=0, tol=1e-3,
+                    quantize=False, lookup=False, return_mask=False):
     """
     calculate exposure time required to achieve specified precision for given inputs
     teff:          Effective Temperature (K)
     vmag:          V-band magnitude
     rv_precision:  Desired Radial Velocity Precision (m/s)
     set use_order=True to calculate exposure time for a specific order
+
+    tol:           tolerance (s) of the returned exposure time
+    quantize:      round up to the 2 s steps of the original linear scan
+    lookup:        find the exptime cell in the prebuilt inverse tables (same answer;
+                   build them with python -m neid_calculator.inverse_tables build and
+                   point NEID_INVERSE_TABLES at them when built elsewhere)
+    inputs may be scalars or broadcastable arrays; targets that need more than
+    3600 s are NaN
     """
-    
-    
-    exptime_grid = fits.open(path_to_grid+'photon_grid_exptime.fits')[0].data
-    teff_grid = fits.open(path_to_grid+'photon_grid_teff.fits')[0].data
-    vmag_grid = fits.open(path_to_grid+'photon_grid_vmag.fits')[0].data
-    logexp=np.log10(exptime_grid)
-    
-    bound_test=True
-    if teff<np.min(teff_grid) or teff>np.max(teff_grid):
-        print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
-        bound_test=False
-    if vmag<np.min(vmag_grid) or vmag>np.max(vmag_grid):
-        print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
-        bound_test=False
-    if bound_test==False:
-        return np.nan
-    
+
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(rv_precision)==0
+
     if use_order==True:
-        order_grid = fits.open(path_to_grid+'order_wvl_centers.fits')[0].data[0]
-        order_loc=np.where(order_grid==order)[0][0]
-        rvprec_grid_order = fits.open(path_to_grid+'dv_uncertainty_master_order.fits')[0].data
-        rvprec_grid=rvprec_grid_order[order_loc]
+        exptime, mask = _solve_exptime(grids, 'rvprec_grid_order', teff, vmag, rv_precision,
+                                       order_loc=_order_index(grids, order), decreasing=True,
+                                       tol=tol, quantize=quantize, lookup=lookup, verbose=verbose)
     else:
-        rvprec_grid = fits.open(path_to_grid+'dv_uncertainty_master.fits')[0].data
-
-    teff_index=InterpolatedUnivariateSpline(teff_grid, 
-                            np.arange(len(teff_grid), dtype=np.double))(teff)
-
-    vmag_index=InterpolatedUnivariateSpline(vmag_grid, 
-                            np.arange(len(vmag_grid), dtype=np.double))(vmag)        
-    j=0
-    eta=1e10
-    while eta>rv_precision:
-        exptime=2*(j+6)
-        if exptime>np.max(exptime_grid):
-            print("\nMaximum Exposure Time Exceeded (t>3600s).\n")
-            return np.nan
-        exptime_index=InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),
-                                                dtype=np.double))(np.log10(exptime))
-        rvprec_interpolator=RegularGridInterpolator((np.arange(len(exptime_grid)),
-                              np.arange(len(vmag_grid)),
-                              np.arange(len(teff_grid))),
-                                    rvprec_grid)
-        inputs=[exptime_index, vmag_index, teff_index]
-        eta=rvprec_interpolator(inputs)[0]
-        j+=1
-    
-    return exptime
+        exptime, mask = _solve_exptime(grids, 'rvprec_grid', teff, vmag, rv_precision, decreasing=True,
+                                       tol=tol, quantize=quantize, lookup=lookup, verbose=verbose)
+
+    return _result(exptime, mask, return_mask)
 
 
-def NEID_SNR(teff, vmag, exptime, wavelength):
+def NEID_SNR(teff, vmag, exptime, wavelength, nearest=False, return_mask=False):
     """
     calculate expected SNR for the given inputs
     teff:          Effective Temperature (K)
     vmag:          V-band magnitude
     exptime:       Exposure time (s)
     wavelength:    wavelength (nm) at which SNR should be calculated
+    set nearest=True to use the order centered closest to the wavelength instead
+    of requiring an order center within 0.1 nm
+
+    inputs may be scalars or broadcastable arrays, see NEID_RV_prec
     """
-    
-    exptime_grid = fits.open(path_to_grid+'photon_grid_exptime.fits')[0].data
-    teff_grid = fits.open(path_to_grid+'photon_grid_teff.fits')[0].data
-    vmag_grid = fits.open(path_to_grid+'photon_grid_vmag.fits')[0].data
-    logexp=np.log10(exptime_grid)
-    
-    bound_test=True
-    if teff<np.min(teff_grid) or teff>np.max(teff_grid):
-        print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
-        bound_test=False
-    if vmag<np.min(vmag_grid) or vmag>np.max(vmag_grid):
-        print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
-        bound_test=False
-    if exptime<np.min(exptime_grid) or exptime>np.max(exptime_grid):
-        print("Exposure time out of bounds. The allowed range is %d s to %d s." % (np.min(exptime_grid), np.max(exptime_grid)))
-        bound_test=False
-    if bound_test==False:
-        return np.nan
-    
-    wavelength_grid = fits.open(path_to_grid+'order_wvl_centers.fits')[0].data[1]
-    order_loc=np.where(np.abs(wavelength_grid-wavelength)<0.1)[0][0]
-    snr_grid_order=fits.open(path_to_grid+'snr_master_order.fits')[0].data
-    snr_grid=snr_grid_order[order_loc]
 
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(exptime)==0 and np.ndim(wavelength)==0
+
+    order_loc = _wavelength_match(grids, wavelength)[0] if nearest else _wavelength_index(grids, wavelength)
+    values, mask = _evaluate(grids, 'snr_grid_order', teff, vmag, exptime,
+                             order_loc=order_loc, verbose=verbose)
+
+    return _result(values, mask, return_mask)
     
-    teff_index=InterpolatedUnivariateSpline(teff_grid, 
-                            np.arange(len(teff_grid), dtype=np.double))(teff)
-
-    vmag_index=InterpolatedUnivariateSpline(vmag_grid, 
-                            np.arange(len(vmag_grid), dtype=np.double))(vmag)
-    exptime_index=InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),
-                                                dtype=np.double))(np.log10(exptime))
-    snr_interpolator=RegularGridInterpolator((np.arange(len(exptime_grid)),
-                          np.arange(len(vmag_grid)),
-                          np.arange(len(teff_grid))),
-                                snr_grid)
-    inputs=[exptime_index, vmag_index, teff_index]
-    snr=snr_interpolator(inputs)[0]
-    
-    return snr
-    
-def NEID_exptime_SNR(teff, vmag, snr, wavelength):
+
+def NEID_exptime_SNR(teff, vmag, snr, wavelength, tol=1e-3, quantize=False, lookup=False,
+                     return_mask=False):
     """
     calculate exposure time required to achieve specified SNR for given inputs
     teff:          Effective Temperature (K)
     vmag:          V-band magnitude
     snr:           Desired SNR
     wavelength:    wavelength (nm) at which exposure time should be calculated
+
+    tol, quantize, lookup and array inputs as in NEID_exptime_RV
     """
-    
-    exptime_grid = fits.open(path_to_grid+'photon_grid_exptime.fits')[0].data
-    teff_grid = fits.open(path_to_grid+'photon_grid_teff.fits')[0].data
-    vmag_grid = fits.open(path_to_grid+'photon_grid_vmag.fits')[0].data
-    logexp=np.log10(exptime_grid)
-    
-    bound_test=True
-    if teff<np.min(teff_grid) or teff>np.max(teff_grid):
-        print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
-        bound_test=False
-    if vmag<np.min(vmag_grid) or vmag>np.max(vmag_grid):
-        print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
-        bound_test=False
-    if bound_test==False:
-        return np.nan
-    
-    wavelength_grid = fits.open(path_to_grid+'order_wvl_centers.fits')[0].data[1]
-    order_loc=np.where(np.abs(wavelength_grid-wavelength)<0.1)[0][0]
-    snr_grid_order=fits.open(path_to_grid+'snr_master_order.fits')[0].data
-    snr_grid=snr_grid_order[order_loc]
-        
-    
-    teff_index=InterpolatedUnivariateSpline(teff_grid, 
-                            np.arange(len(teff_grid), dtype=np.double))(teff)
-
-    vmag_index=InterpolatedUnivariateSpline(vmag_grid, 
-                            np.arange(len(vmag_grid), dtype=np.double))(vmag)  
-    j=0
-    eta=0
-    while eta<snr:
-        exptime=2*(j+6)
-        if exptime>np.max(exptime_grid):
-            print("\nMaximum Exposure Time Exceeded (t>3600s).\n")
-            return np.nan
-        exptime_index=InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),
-                                                dtype=np.double))(np.log10(exptime))
-        snr_interpolator=RegularGridInterpolator((np.arange(len(exptime_grid)),
-                              np.arange(len(vmag_grid)),
-                              np.arange(len(teff_grid))),
-                                    snr_grid)
-        inputs=[exptime_index, vmag_index, teff_index]
-        eta=snr_interpolator(inputs)[0]
-        j+=1
-    return exptime
 
-def NEID_max_exptime(teff, vmag, exptime=60.):
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(snr)==0 and np.ndim(wavelength)==0
+
+    exptime, mask = _solve_exptime(grids, 'snr_grid_order', teff, vmag, snr,
+                                   order_loc=_wavelength_index(grids, wavelength),
+                                   tol=tol, quantize=quantize, lookup=lookup, verbose=verbose)
+
+    return _result(exptime, mask, return_mask)
+
+def NEID_nearest_order(wavelength):
+    """
+    order number and center wavelength (nm) of the order centered closest to
+    each wavelength
+    wavelength:    wavelength (nm), scalar or array
+    """
+
+    grids = grid_store.get_store()
+    loc = _wavelength_match(grids, wavelength)[0]
+    return grids.order_grid[loc][()], grids.wavelength_grid[loc][()]
+
+
+def NEID_order_match(wavelength):
+    """
+    position of the order centered closest to each wavelength, in the order of
+    NEID_order_profile's columns, and whether it is centered within 0.1 nm of it
+    wavelength:    wavelength (nm), scalar or array
+    """
+
+    loc, matched = _wavelength_match(grid_store.get_store(), wavelength)
+    return loc[()], matched[()]
+
+
+def NEID_order_profile(teff, vmag, exptime, return_mask=False):
+    """
+    calculate expected SNR and RV precision in every order for the given inputs
+    teff:          Effective Temperature (K)
+    vmag:          V-band magnitude
+    exptime:       Exposure time (s)
+
+    returns a dict with the order numbers and center wavelengths (nm) of the
+    orders, and the per-order 'snr' and 'rv_precision' as arrays of shape
+    (..., number of orders) for array inputs. every order of every target is
+    interpolated in one pass per cube; out of bounds targets are NaN
+    """
+
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(exptime)==0
+
+    snr, mask = _evaluate_orders(grids, 'snr_grid_order', teff, vmag, exptime, verbose=verbose)
+    rv_precision, _ = _evaluate_orders(grids, 'rvprec_grid_order', teff, vmag, exptime)
+    profile = {'order': grids.order_grid, 'wavelength': grids.wavelength_grid,
+               'snr': snr, 'rv_precision': rv_precision}
+    if return_mask:
+        return profile, mask[()]
+    return profile
+
+def NEID_max_exptime(teff, vmag, exptime=60., quantize=True, return_mask=False):
     """
     calculate max recommended exposure time (60% full well) for a given target
     
     teff:          Effective Temperature (K)
     vmag:          V-band magnitude
     exptime:       Exposure time (s)
+
+    the SNR of every order is interpolated in one pass, and the exposure time at
+    which the order closest to its soft limit saturates is solved on the same
+    cube. inputs may be scalars or broadcastable arrays; targets that do not
+    saturate within 3600 s get 3600. quantize as in NEID_exptime_RV
     """
     
-    exptime_grid = fits.open(path_to_grid+'photon_grid_exptime.fits')[0].data
-    teff_grid = fits.open(path_to_grid+'photon_grid_teff.fits')[0].data
-    vmag_grid = fits.open(path_to_grid+'photon_grid_vmag.fits')[0].data
-    logexp=np.log10(exptime_grid)
-    
-    bound_test=True
-    if teff<np.min(teff_grid) or teff>np.max(teff_grid):
-        print("Temperature out of bounds. The allowed range is %d K to %d K." % (np.min(teff_grid), np.max(teff_grid)))
-        bound_test=False
-    if vmag<np.min(vmag_grid) or vmag>np.max(vmag_grid):
-        print("Magnitude out of bounds. The allowed range is V = %d to V = %d." % (np.min(vmag_grid), np.max(vmag_grid)))
-        bound_test=False
-    if exptime<np.min(exptime_grid) or exptime>np.max(exptime_grid):
-        print("Exposure time out of bounds. The allowed range is %d s to %d s." % (np.min(exptime_grid), np.max(exptime_grid)))
-        bound_test=False
-    if bound_test==False:
-        return np.nan
-    
-    wavelength_grid = fits.open(path_to_grid+'order_wvl_centers.fits')[0].data[1]
-    snr_grid_order=fits.open(path_to_grid+'snr_master_order.fits')[0].data
-    
-    
-    teff_index=InterpolatedUnivariateSpline(teff_grid, 
-                            np.arange(len(teff_grid), dtype=np.double))(teff)
-
-    vmag_index=InterpolatedUnivariateSpline(vmag_grid, 
-                            np.arange(len(vmag_grid), dtype=np.double))(vmag)
-    exptime_index=InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),
-                                                dtype=np.double))(np.log10(exptime))
-    snr=np.zeros(len(snr_grid_order))
-    for o in range(len(snr_grid_order)):
-        snr_grid=snr_grid_order[o]
-        snr_interpolator=RegularGridInterpolator((np.arange(len(exptime_grid)),
-                              np.arange(len(vmag_grid)),
-                              np.arange(len(teff_grid))),
-                                    snr_grid)
-        inputs=[exptime_index, vmag_index, teff_index]
-        snr[o]=snr_interpolator(inputs)[0]
-    
-    softlimit=np.array([497.82248, 500.46307, 499.61078, 495.75638, 495.59677, 497.53268,
-       494.92285, 497.87125, 495.24042, 499.50885, 499.4121 , 495.15826,
-       498.5816 , 498.41797, 494.5738 , 498.28055, 495.77396, 495.66986,
-       497.76923, 495.65466, 495.5136 , 494.9543 , 497.7236 , 496.294  ,
-       494.54578, 492.45773, 493.8629 , 495.3245 , 496.50537, 497.20462,
-       496.3666 , 493.56155, 495.66016, 495.95648, 495.29364, 493.72418,
-       495.75903, 496.19632, 494.97125, 492.46533, 496.4472 , 494.52365,
-       493.13345, 494.53046, 495.96414, 494.08124, 491.92264, 494.0127 ,
-       495.47772, 495.2882 , 495.43652, 494.86865, 495.158  , 495.0169 ,
-       494.81766, 495.0668 , 495.3031 , 493.20224, 494.71045, 493.0483 ,
-       495.01123, 494.97443, 492.57593, 493.84567, 490.0411 , 493.2728 ,
-       491.09906, 494.50082, 493.13843, 494.31946, 494.4462 , 491.75977,
-       493.00977, 491.4752 , 491.64948, 492.39023, 492.10922, 489.91223,
-       494.3898 , 494.33267, 490.79178, 493.4196 , 491.94476, 494.1685 ,
-       492.94263, 494.19852, 489.60358, 492.3478 , 490.21204, 493.80936,
-       489.8438 , 490.6124 , 490.24118, 493.70288, 491.47467])
-    
-    peak_arg=np.argmax(snr/softlimit)
-    wvl=wavelength_grid[peak_arg]
-    snr_threshold=softlimit[peak_arg]
-    
-    max_exp=NEID_exptime_SNR(teff, vmag, snr_threshold, wvl)
-    if np.isnan(max_exp):
-        max_exp=3600.
-    
-    return max_exp
+    grids = grid_store.get_store()
+    verbose = np.ndim(teff)==0 and np.ndim(vmag)==0 and np.ndim(exptime)==0
+
+    teff, vmag = np.broadcast_arrays(*[np.asarray(a, dtype=np.double) for a in (teff, vmag, exptime)])[:2]
+    snr, mask = _evaluate_orders(grids, 'snr_grid_order', teff, vmag, exptime, verbose=verbose)
+    max_exp=np.full(mask.shape, np.nan)
+    if np.any(mask):
+        snr=snr[mask]
+        peak_arg=np.argmax(snr/grids.softlimit, axis=1)
+        snr_threshold=grids.softlimit[peak_arg]
+        solution, _ = _solve_exptime(grids, 'snr_grid_order', teff[mask], vmag[mask], snr_threshold,
+                                     order_loc=peak_arg, quantize=quantize)
+        max_exp[mask]=np.where(np.isnan(solution), grids.exptime_grid[-1], solution)
+
+    return _result(max_exp, mask, return_mask)
@@ -0,0 +1,177 @@
+import collections
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+
+
+"""
+bounded memoizing layer between calc_shell and neid_etcalc_public
+
+scalar arguments are rounded to a configurable number of significant digits
+before they are used as keys (and before the function is called, so a cached
+value is exactly the result for its key). entries are evicted least recently
+used first once the cache holds maxsize of them. with a path the entries are
+also kept in an sqlite file that every gunicorn worker on the host shares.
+
+the cache is tied to the grid files: at most every check_interval seconds it
+checks whether they have changed, and if so reloads the grid store and drops
+every cached result.
+"""
+
+
+def _quantize(value, digits):
+    if isinstance(value, (float, np.floating)):
+        return float('%.*g' % (digits, value))
+    return value
+
+
+class ResultCache(object):
+    """
+    maxsize:          maximum number of cached results
+    digits:           significant digits kept in numeric arguments
+    path:             optional sqlite file shared between processes
+    check_interval:   seconds between checks for updated grid files
+    """
+
+    def __init__(self, maxsize=4096, digits=6, path=None, check_interval=5.):
+        self.maxsize = maxsize
+        self.digits = digits
+        self.path = path
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._checked = time.time()
+        self._generation = None
+        self._connection = None
+        self._pid = None
+
+    def _db(self):
+        # sqlite connections must not cross a fork, so each process opens its own
+        if self._connection is None or self._pid!=os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                     '(key TEXT PRIMARY KEY, generation TEXT, value BLOB, used REAL)')
+            self._pid = os.getpid()
+        return self._connection
+
+    def _check_grids(self):
+        now = time.time()
+        if now-self._checked<self.check_interval and self._generation is not None:
+            return
+        self._checked = now
+        if grid_store.changed():
+            grid_store.reload()
+        generation = repr(grid_store.get_store().fingerprint)
+        if generation!=self._generation:
+            self._generation = generation
+            self._entries.clear()
+            if self.path:
+                self._db().execute('DELETE FROM results WHERE generation!=?', (generation,))
+
+    def call(self, func, *args, **kwargs):
+        """
+        return func(*args, **kwargs) with numeric arguments quantized, from the
+        cache when possible
+        """
+        args = tuple(_quantize(arg, self.digits) for arg in args)
+        kwargs = {name: _quantize(value, self.digits) for name, value in kwargs.items()}
+
+        with self._lock:
+            self._check_grids()
+            # results computed from older grids can never match
+            key = repr((self._generation, func.__module__, func.__name__, args, sorted(kwargs.items())))
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if self.path:
+                row = self._db().execute('SELECT value FROM results WHERE key=?', (key,)).fetchone()
+                if row is not None:
+                    self._db().execute('UPDATE results SET used=? WHERE key=?', (time.time(), key))
+                    self.hits += 1
+                    value = pickle.loads(row[0])
+                    self._store(key, value)
+                    return value
+            self.misses += 1
+
+        value = func(*args, **kwargs)
+        with self._lock:
+            self._store(key, value)
+            if self.path:
+                self._share(key, value)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries)>self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _share(self, key, value):
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                   (key, self._generation, pickle.dumps(value), time.time()))
+        excess = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]-self.maxsize
+        if excess>0:
+            db.execute('DELETE FROM results WHERE key IN '
+                       '(SELECT key FROM results ORDER BY used LIMIT ?)', (excess,))
+            self.shared_evictions += excess
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._db().execute('DELETE FROM results')
+
+    def stats(self):
+        """
+        hit, miss and eviction counters of this process and the current sizes of
+        the local and shared stores
+        """
+        with self._lock:
+            size = len(self._entries)
+            shared = self._db().execute('SELECT COUNT(*) FROM results').fetchone()[0] if self.path else None
+        lookups = self.hits+self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'shared_evictions': self.shared_evictions, 'hit_rate': self.hits/lookups if lookups else 0.,
+                'size': size, 'shared_size': shared, 'maxsize': self.maxsize, 'digits': self.digits}
+
+
+_cache = ResultCache()
+
+
+def configure(maxsize=4096, digits=6, path=None, check_interval=5.):
+    """
+    replace the process-wide cache used by cached(); see ResultCache
+    """
+    global _cache
+    _cache = ResultCache(maxsize=maxsize, digits=digits, path=path, check_interval=check_interval)
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def cached(func):
+    """
+    wrap func so that its calls go through the process-wide cache
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _cache.call(func, *args, **kwargs)
+    return wrapper
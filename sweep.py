@@ -0,0 +1,154 @@
+import collections
+import threading
+
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+whole-curve sweeps for interactive plots
+
+each function returns a curve over vectors of magnitudes, temperatures or
+exposure times in one vectorized call, e.g. the exposure time needed for SNR 100
+at 573.6 nm as a function of magnitude:
+
+    import neid_calculator.sweep as sweep
+    exptime = sweep.exptime_SNR(5000., np.linspace(3, 17, 100), 100., 573.6)
+
+the model cubes are first interpolated in teff and vmag at every node of the
+exptime axis. those node curves are cached (per order and per teff/vmag vector),
+so when only the SNR or RV target or the exposure time changes between calls,
+only the cheap solve along the exptime axis is redone, and a new teff or
+wavelength costs one batched interpolation. points outside the grids are NaN;
+nothing is printed.
+"""
+
+CACHE_SIZE = 64
+
+_lock = threading.Lock()
+
+
+def _node_cache(grids):
+    return grids.cached('sweep_nodes', collections.OrderedDict)
+
+
+def _nodes(grids, name, teff, vmag, order_loc=None):
+    """
+    node curves (see neid_etcalc_public._exptime_nodes) for every (teff, vmag
+    [, order]) point of the broadcast inputs, from the cache when possible;
+    returns the curves (shape + (len(exptime_grid),)) and the in-bounds mask
+    """
+    arrays=[teff, vmag] if order_loc is None else [teff, vmag, order_loc]
+    arrays=np.broadcast_arrays(*[np.asarray(a, dtype=np.double) for a in arrays])
+    key=(name,)+tuple((a.shape, a.tobytes()) for a in arrays)
+    cache=_node_cache(grids)
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+    teff, vmag = arrays[:2]
+    mask=np.array(etc._in_bounds(grids, teff, vmag))
+    nodes=np.full(mask.shape+(len(grids.exptime_grid),), np.nan)
+    if np.any(mask):
+        order=None if order_loc is None else arrays[2][mask].astype(int)
+        nodes[mask]=etc._exptime_nodes(grids, name, teff[mask], vmag[mask], order)
+    nodes.flags.writeable=False
+    mask.flags.writeable=False
+    with _lock:
+        cache[key]=(nodes, mask)
+        while len(cache)>CACHE_SIZE:
+            cache.popitem(last=False)
+    return nodes, mask
+
+
+def _broadcast_rows(nodes, mask, values):
+    """
+    flatten the node curves and a value array onto their common shape
+    """
+    shape=np.broadcast_shapes(mask.shape, np.shape(values))
+    rows=np.broadcast_to(np.arange(mask.size).reshape(mask.shape), shape).ravel()
+    nodes=nodes.reshape(-1, nodes.shape[-1])[rows]
+    mask=mask.ravel()[rows]
+    values=np.broadcast_to(np.asarray(values, dtype=np.double), shape).ravel()
+    return shape, nodes, mask, values
+
+
+def _values(grids, nodes, mask, exptime):
+    shape, nodes, mask, exptime = _broadcast_rows(nodes, mask, exptime)
+    mask=mask & (exptime>=grids.exptime_grid[0]) & (exptime<=grids.exptime_grid[-1])
+    values=np.full(shape, np.nan).ravel()
+    if np.any(mask):
+        values[mask]=etc._node_value(grids, nodes[mask], exptime[mask])
+    return values.reshape(shape)[()]
+
+
+def _exptimes(grids, nodes, mask, target, decreasing, tol, quantize):
+    shape, nodes, mask, target = _broadcast_rows(nodes, mask, target)
+    exptime=np.full(shape, np.nan).ravel()
+    if np.any(mask):
+        exptime[mask]=etc._solve_nodes(grids, nodes[mask], target[mask], decreasing=decreasing,
+                                       tol=tol, quantize=quantize)
+    return exptime.reshape(shape)[()]
+
+
+def _rv_cube(grids, use_order, order):
+    if use_order:
+        return 'rvprec_grid_order', etc._order_index(grids, order)
+    return 'rvprec_grid', None
+
+
+def SNR(teff, vmag, exptime, wavelength):
+    """
+    SNR curve, see neid_etcalc_public.NEID_SNR
+    teff:          Effective Temperature (K)
+    vmag:          V-band magnitude
+    exptime:       Exposure time (s)
+    wavelength:    wavelength (nm) at which SNR should be calculated
+
+    the inputs are broadcast against each other, any of them may be the sweep vector
+    """
+    grids = grid_store.get_store()
+    nodes, mask = _nodes(grids, 'snr_grid_order', teff, vmag, etc._wavelength_index(grids, wavelength))
+    return _values(grids, nodes, mask, exptime)
+
+
+def RV_prec(teff, vmag, exptime, use_order=False, order=0):
+    """
+    RV precision curve, see neid_etcalc_public.NEID_RV_prec
+    teff:          Effective Temperature (K)
+    vmag:          V-band magnitude
+    exptime:       Exposure time (s)
+    """
+    grids = grid_store.get_store()
+    name, order_loc = _rv_cube(grids, use_order, order)
+    nodes, mask = _nodes(grids, name, teff, vmag, order_loc)
+    return _values(grids, nodes, mask, exptime)
+
+
+def exptime_SNR(teff, vmag, snr, wavelength, tol=1e-3, quantize=False):
+    """
+    exposure time curve for an SNR goal, see neid_etcalc_public.NEID_exptime_SNR
+    teff:          Effective Temperature (K)
+    vmag:          V-band magnitude
+    snr:           Desired SNR
+    wavelength:    wavelength (nm) at which exposure time should be calculated
+    """
+    grids = grid_store.get_store()
+    nodes, mask = _nodes(grids, 'snr_grid_order', teff, vmag, etc._wavelength_index(grids, wavelength))
+    return _exptimes(grids, nodes, mask, snr, False, tol, quantize)
+
+
+def exptime_RV(teff, vmag, rv_precision, use_order=False, order=0, tol=1e-3, quantize=False):
+    """
+    exposure time curve for an RV precision goal, see neid_etcalc_public.NEID_exptime_RV
+    teff:          Effective Temperature (K)
+    vmag:          V-band magnitude
+    rv_precision:  Desired Radial Velocity Precision (m/s)
+    """
+    grids = grid_store.get_store()
+    name, order_loc = _rv_cube(grids, use_order, order)
+    nodes, mask = _nodes(grids, name, teff, vmag, order_loc)
+    return _exptimes(grids, nodes, mask, rv_precision, True, tol, quantize)
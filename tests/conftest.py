@@ -0,0 +1,31 @@
+import importlib.util
+import os
+import shutil
+import sys
+
+import pytest
+
+
+# run from a checkout: load the repository directory as the neid_calculator
+# package unless it is installed
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if importlib.util.find_spec('neid_calculator') is None:
+    spec = importlib.util.spec_from_file_location('neid_calculator', os.path.join(ROOT, '__init__.py'),
+                                                  submodule_search_locations=[ROOT])
+    sys.modules['neid_calculator'] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules['neid_calculator'])
+
+import neid_calculator.grid_store as grid_store
+
+
+@pytest.fixture
+def grid_copy(tmp_path, monkeypatch):
+    """
+    a copy of the grid directory (FITS files and bundle) that the grid store reads
+    """
+    for name in sorted(grid_store.GRID_FILES.values())+['neid_grids.bundle']:
+        shutil.copy2(os.path.join(ROOT, name), str(tmp_path))
+    monkeypatch.delenv('NEID_GRID_FORMAT', raising=False)
+    grid_store.configure(str(tmp_path))
+    yield tmp_path
+    grid_store.configure(None)
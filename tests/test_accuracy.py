@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+import neid_calculator.accuracy as accuracy
+import neid_calculator.grid_store as grid_store
+import neid_calculator.inverse_tables as inverse_tables
+import neid_calculator.nd_grid as nd_grid
+import neid_calculator.neid_etcalc_public as etc
+
+
+def _failures(report):
+    return {name: case for name, case in report.items() if case['failures']}
+
+
+def test_reference_values():
+    assert _failures(accuracy.check())=={}
+
+
+def test_fits_grids_match_reference(grid_copy, monkeypatch):
+    monkeypatch.setenv('NEID_GRID_FORMAT', 'fits')
+    grid_store.configure(str(grid_copy))
+    assert grid_store.get_store().source=='fits'
+    assert _failures(accuracy.check())=={}
+
+
+def test_chunked_grids_match_reference(grid_copy, monkeypatch):
+    # chunks split along every axis, so interpolation crosses chunk boundaries
+    os.remove(str(grid_copy/'neid_grids.bundle'))
+    nd_grid.build(str(grid_copy), chunks={'order': 4, 'exptime': 3, 'vmag': 4, 'teff': 5})
+    grid_store.configure(str(grid_copy))
+    assert grid_store.get_store().source=='chunked'
+    assert _failures(accuracy.check())=={}
+
+
+def test_inverse_tables_match_solver(grid_copy):
+    inverse_tables.build(str(grid_copy/'tables'), verbose=False)
+    report = inverse_tables.validate(str(grid_copy/'tables'), n_points=2000)
+    assert all(stats['ok'] for stats in report.values()), report
+
+
+def test_lookup_quantized_matches_solver(grid_copy, monkeypatch):
+    inverse_tables.build(str(grid_copy/'tables'), verbose=False)
+    monkeypatch.setenv('NEID_INVERSE_TABLES', str(grid_copy/'tables'))
+    rng = np.random.default_rng(1)
+    teff = rng.uniform(2700, 6600, 500)
+    vmag = rng.uniform(3, 17, 500)
+    goal = 10**rng.uniform(-1, 1.5, 500)
+    np.testing.assert_array_equal(etc.NEID_exptime_RV(teff, vmag, goal, quantize=True, lookup=True),
+                                  etc.NEID_exptime_RV(teff, vmag, goal, quantize=True))
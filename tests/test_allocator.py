@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import neid_calculator.allocator as allocator
+import neid_calculator.neid_etcalc_public as etc
+
+
+CURVES = ('max_exptime', 'goal_exposures', 'goal_exptime', 'curve_exposures', 'curve_precision')
+
+
+@pytest.fixture
+def targets():
+    rng = np.random.default_rng(5)
+    n = 60
+    return (rng.uniform(3000, 6500, n), rng.uniform(4, 15, n), rng.uniform(0.3, 3, n),
+            rng.integers(1, 4, n).astype(float))
+
+
+@pytest.mark.parametrize('objective', allocator.OBJECTIVES)
+@pytest.mark.parametrize('budget', [3600., 8*3600.])
+def test_plan_respects_budget(targets, objective, budget):
+    plan = allocator.Allocator(*targets, overhead=30.).plan(budget, objective=objective)
+    assert plan['used']<=budget
+    np.testing.assert_allclose(plan['time'], plan['n_exposures']*(plan['exptime']+30.)*(plan['n_exposures']>0))
+    assert plan['used']==pytest.approx(plan['time'].sum())
+    observed = plan['n_exposures']>0
+    assert np.all(np.isfinite(plan['rv_precision'][observed])) and np.all(np.isnan(plan['rv_precision'][~observed]))
+
+
+def test_goal_plan_meets_the_goals_it_observes(targets):
+    alloc = allocator.Allocator(*targets)
+    plan = alloc.plan(8*3600.)
+    observed = plan['n_exposures']>0
+    assert plan['goals_met']==observed.sum()>0
+    # every exposure stays below saturation, and the visit reaches the goal
+    assert np.all(plan['exptime'][observed]<=alloc.max_exptime[observed])
+    single = etc.NEID_RV_prec(alloc.teff[observed], alloc.vmag[observed], plan['exptime'][observed])
+    np.testing.assert_allclose(plan['rv_precision'][observed], single/np.sqrt(plan['n_exposures'][observed]))
+    assert np.all(plan['rv_precision'][observed]<=alloc.rv_goal[observed])
+
+
+def test_error_plan_gets_better_with_budget(targets):
+    alloc = allocator.Allocator(*targets)
+    errors = [alloc.plan(budget, objective='error')['weighted_error'] for budget in (2*3600., 8*3600., 40*3600.)]
+    assert errors[0]>=errors[1]>=errors[2]
+    with pytest.raises(ValueError):
+        alloc.plan(10., objective='error')
+    with pytest.raises(ValueError):
+        alloc.plan(3600., objective='time')
+
+
+def test_update_recomputes_only_its_row(targets, monkeypatch):
+    alloc = allocator.Allocator(*targets)
+    before = {name: getattr(alloc, name).copy() for name in CURVES}
+    computed = []
+    compute = alloc._compute
+    monkeypatch.setattr(alloc, '_compute', lambda rows: computed.append(rows) or compute(rows))
+
+    alloc.update(7, priority=5.)
+    assert computed==[] and alloc.priority[7]==5.
+    alloc.update(7, teff=4200., vmag=9.5, rv_goal=0.8)
+    assert [list(rows) for rows in computed]==[[7]]
+
+    fresh = allocator.Allocator(4200., [9.5], 0.8)
+    others = np.arange(len(alloc.teff))!=7
+    for name in CURVES:
+        np.testing.assert_array_equal(getattr(alloc, name)[others], before[name][others])
+        np.testing.assert_array_equal(getattr(alloc, name)[7], getattr(fresh, name)[0])
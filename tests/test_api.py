@@ -0,0 +1,71 @@
+import pytest
+
+import neid_calculator.benchmarks as benchmarks
+
+
+@pytest.fixture(scope='module')
+def client():
+    app = benchmarks._test_app()
+    app.config['CALC_MAX_BATCH'] = 10
+    return app.test_client()
+
+
+TARGET = {'temperature': 5500., 'vmag': 8., 'exptime': 300.}
+
+
+def test_batch(client):
+    response = client.post('/calc_shell/api/rv', json=[TARGET, dict(TARGET, vmag=30.)])
+    assert response.status_code==200
+    rows = response.get_json()['results']
+    assert rows[0]['in_bounds'] and rows[0]['rv_precision']>0
+    assert not rows[1]['in_bounds'] and rows[1]['rv_precision'] is None
+
+
+@pytest.mark.parametrize('body, status', [
+    ({}, 400),
+    ([], 400),
+    ([{'temperature': 5500., 'vmag': 8.}], 400),
+    ([dict(TARGET, vmag='bright')], 400),
+    ([TARGET]*11, 413),
+])
+def test_bad_batches(client, body, status):
+    response = client.post('/calc_shell/api/rv', json=body)
+    assert response.status_code==status
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('value', ['Infinity', 'NaN', '"nan"', '"-inf"'])
+def test_non_finite_values_are_rejected(client, value):
+    body = '[{"temperature": %s, "vmag": 8, "exptime": 300}]' % value
+    for route in ('rv', 'snr', 'profile'):
+        response = client.post('/calc_shell/api/'+route, data=body, content_type='application/json')
+        assert response.status_code==400
+        assert 'finite' in response.get_json()['error']
+
+
+def test_snr_page_flashes_the_matched_order(client):
+    form = {'temperature': 5000, 'vmag': 8, 'exptime': 300}
+    page = client.post('/calc_shell/calculate_snr', data=dict(form, wavelength=552.97)).get_data(as_text=True)
+    assert 'SNR = ' in page
+    page = client.post('/calc_shell/calculate_snr', data=dict(form, wavelength=553.5)).get_data(as_text=True)
+    assert 'nearest is order 111 at 552.97 nm' in page
+
+
+def test_quantize_flag(client):
+    targets = [{'temperature': 5500., 'vmag': 8., 'rvprec': 0.7}]
+    times = {}
+    for quantize in (True, False):
+        response = client.post('/calc_shell/api/exp_rv', json={'targets': targets, 'quantize': quantize})
+        assert response.status_code==200
+        times[quantize] = response.get_json()['results'][0]['exptime']
+    assert times[True]%2==0 and times[True]!=times[False]
+    assert client.post('/calc_shell/api/exp_rv', json=targets).get_json()['results'][0]['exptime']==times[True]
+
+
+@pytest.mark.parametrize('route', ['exp_rv', 'exp_snr'])
+@pytest.mark.parametrize('value', ['false', '0', 0, None])
+def test_non_boolean_quantize_is_rejected(client, route, value):
+    target = {'temperature': 5500., 'vmag': 8., 'rvprec': 0.7, 'snr': 100.}
+    response = client.post('/calc_shell/api/'+route, json={'targets': [target], 'quantize': value})
+    assert response.status_code==400
+    assert 'quantize' in response.get_json()['error']
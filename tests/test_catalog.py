@@ -0,0 +1,64 @@
+import csv
+
+import numpy as np
+import pytest
+
+import neid_calculator.catalog as catalog
+import neid_calculator.neid_etcalc_public as etc
+
+
+@pytest.fixture
+def targets(tmp_path):
+    rng = np.random.default_rng(11)
+    n = 103
+    path = str(tmp_path/'targets.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name', 'Teff', 'Vmag', 'exptime', 'snr_goal', 'rv_goal', 'wavelength', 'teff_err',
+                         'vmag_err'])
+        for i in range(n):
+            # some rows off the grids, unmatched wavelengths and missing values
+            writer.writerow(['star%d' % i, '%.1f' % rng.uniform(2500, 6800), '%.3f' % rng.uniform(2, 18),
+                             '%.0f' % rng.uniform(10, 3600), '%.1f' % rng.uniform(5, 300),
+                             '' if i%7==0 else '%.2f' % rng.uniform(0.2, 5),
+                             rng.choice(['', '552.97', '573.6', '553.5']), '%.0f' % rng.uniform(0, 200),
+                             '%.2f' % rng.uniform(0, 0.3)])
+    return path
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+@pytest.mark.parametrize('samples', [0, 50])
+def test_workers_give_the_same_result(targets, tmp_path, samples):
+    outputs = []
+    for workers in (1, 3):
+        output = str(tmp_path/('results%d.csv' % workers))
+        assert catalog.run(targets, output, workers=workers, chunk_size=10, progress=False, samples=samples,
+                           seed=4)==103
+        outputs.append(_read(output))
+    assert outputs[0]==outputs[1]
+    assert tuple(outputs[0][0])==catalog.output_columns(samples)
+    assert [row[0] for row in outputs[0][1:]]==['star%d' % i for i in range(103)]
+
+
+def test_evaluate_matches_calculator(targets):
+    chunk = next(catalog.read_targets(targets, chunk_size=1000))
+    result = catalog.evaluate(chunk, quantize=True)
+    teff, vmag, exptime = chunk['teff'], chunk['vmag'], chunk['exptime']
+    wavelength = np.where(np.isnan(chunk['wavelength']), 552.97, chunk['wavelength'])
+    matched = etc.NEID_order_match(wavelength)[1]
+    assert 0<matched.sum()<len(matched)
+    np.testing.assert_array_equal(result['wavelength'], wavelength)
+    np.testing.assert_array_equal(result['rv_precision'], etc.NEID_RV_prec(teff, vmag, exptime))
+    np.testing.assert_array_equal(result['exptime_rv'], etc.NEID_exptime_RV(teff, vmag, chunk['rv_goal'],
+                                                                            quantize=True))
+    np.testing.assert_array_equal(result['max_exptime'], etc.NEID_max_exptime(teff, vmag))
+    snr = np.array([etc.NEID_SNR(t, v, e, w) if m else np.nan
+                    for t, v, e, w, m in zip(teff, vmag, exptime, wavelength, matched)])
+    np.testing.assert_allclose(result['snr'], snr, rtol=1e-12)
+    exptime_snr = np.array([etc.NEID_exptime_SNR(t, v, g, w, quantize=True) if m else np.nan
+                            for t, v, g, w, m in zip(teff, vmag, chunk['snr_goal'], wavelength, matched)])
+    np.testing.assert_allclose(result['exptime_snr'], exptime_snr, rtol=1e-12)
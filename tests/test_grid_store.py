@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+import neid_calculator.result_cache as result_cache
+
+
+def _scale_fits(path, factor):
+    from astropy.io import fits
+
+    with fits.open(path, mode='update') as hdul:
+        hdul[0].data *= factor
+
+
+def test_changed_fits_grid_invalidates_store_and_cache(grid_copy):
+    assert grid_store.get_store().source=='bundle'
+    cache = result_cache.ResultCache(check_interval=0)
+    before = cache.call(etc.NEID_SNR, 5000., 8., 300., 552.97)
+    assert not grid_store.changed()
+
+    _scale_fits(str(grid_copy/'snr_master_order.fits'), 2)
+    assert grid_store.changed()
+    # the bundle no longer matches its FITS files, so the reloaded store reads them
+    with pytest.warns(UserWarning, match='stale'):
+        after = cache.call(etc.NEID_SNR, 5000., 8., 300., 552.97)
+    assert grid_store.get_store().source=='fits'
+    assert after==pytest.approx(2*before)
+    assert etc.NEID_SNR(5000., 8., 300., 552.97)==pytest.approx(2*before)
+
+
+def test_touched_fits_grid_keeps_bundle(grid_copy):
+    grid_store.get_store()
+    os.utime(str(grid_copy/'snr_master_order.fits'))
+    assert grid_store.changed()
+    assert grid_store.reload().source=='bundle'
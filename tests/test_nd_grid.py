@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.inverse_tables as inverse_tables
+import neid_calculator.nd_grid as nd_grid
+
+
+@pytest.fixture
+def grid(tmp_path):
+    axes = [nd_grid.Axis('order', [3., 2., 1.], interpolate=False),
+            nd_grid.Axis('logg', [4., 4.5, 5.], default=4.5),
+            nd_grid.Axis('exptime', [10., 100., 1000., 3600.], log=True),
+            nd_grid.Axis('vmag', [3., 5., 7., 9., 11.]),
+            nd_grid.Axis('teff', [3000., 4000., 5000., 6000.])]
+    data = np.random.default_rng(0).random((3, 3, 4, 5, 4))
+    path = str(tmp_path/'grid.ndgrid')
+    nd_grid.write(path, axes, {'cube': (('order', 'logg', 'exptime', 'vmag', 'teff'), data)},
+                  chunks={'cube': (1, 2, 2, 3, 2)})
+    return nd_grid.NDGrid(path, cache_bytes=3000), data
+
+
+def _multilinear(data, position):
+    # reference: blend the corners of the cell around every fractional index
+    cells = [min(int(p), n-2) for p, n in zip(position, data.shape)]
+    value = 0.
+    for corner in np.ndindex(*(2,)*len(position)):
+        weight = 1.
+        for p, c, upper in zip(position, cells, corner):
+            weight *= p-c if upper else 1-(p-c)
+        value += weight*data[tuple(c+u for c, u in zip(cells, corner))]
+    return value
+
+
+def test_slicing_reads_across_chunks(grid):
+    grid, data = grid
+    cube = grid.cubes['cube']
+    for key in [(1,), (slice(None), 2), (Ellipsis, slice(1, 4)), (0, slice(None, None, 2), -1),
+                (slice(2, 0, -1), 1, 3)]:
+        np.testing.assert_array_equal(cube[key], data[key])
+    np.testing.assert_array_equal(np.asarray(cube), data)
+
+
+def test_interpolation_at_chunk_boundaries(grid):
+    grid, data = grid
+    cube = grid.cubes['cube']
+    rng = np.random.default_rng(1)
+    # cells on both sides of every chunk boundary, nodes shared by two chunks,
+    # and the last node of every axis
+    positions = np.column_stack([rng.integers(0, 3, 400), rng.uniform(0, 2, 400), rng.uniform(0, 3, 400),
+                                 rng.uniform(0, 4, 400), rng.uniform(0, 3, 400)])
+    positions[:50, 2:] = np.array([1., 2., 1.])
+    positions[50:100, 1:] = np.array([2., 3., 4., 3.])
+    expected = [_multilinear(data[int(p[0])], p[1:]) for p in positions]
+    np.testing.assert_allclose(cube.interpolate(positions), expected, rtol=1e-13)
+    assert grid.cache.nbytes<=grid.cache.max_bytes
+
+
+def test_defaults_and_bounds(grid):
+    grid, data = grid
+    assert grid.interpolate('cube', order=2., exptime=100., vmag=7., teff=5000.)==data[1, 1, 1, 2, 2]
+    values = grid.interpolate('cube', order=[2., 2.5], exptime=100., vmag=[7., 7.], teff=5000.)
+    assert values[0]==data[1, 1, 1, 2, 2] and np.isnan(values[1])
+    assert np.isnan(grid.interpolate('cube', order=1., exptime=5., vmag=7., teff=5000.))
+    interpolator = nd_grid.ChunkedInterpolator(grid.cubes['cube'])
+    np.testing.assert_allclose(interpolator(np.array([[1., 2., 2.]]), order=[1]), [data[1, 1, 1, 2, 2]])
+
+
+def test_float32_grid_has_its_own_checksum(grid_copy, monkeypatch):
+    monkeypatch.setenv('NEID_GRID_FORMAT', 'fits')
+    grid_store.configure(str(grid_copy))
+    exact = grid_store.get_store().checksum()
+    inverse_tables.build(str(grid_copy/'tables'), verbose=False)
+
+    for float32 in (False, True):
+        monkeypatch.setenv('NEID_GRID_FORMAT', 'fits')
+        nd_grid.build(str(grid_copy), float32=float32)
+        monkeypatch.setenv('NEID_GRID_FORMAT', 'chunked')
+        grids = grid_store.reload()
+        assert grids.source=='chunked'
+        if float32:
+            # tables built from the exact grids are not accepted against rounded cubes
+            assert grids.checksum()!=exact
+            with pytest.raises(ValueError, match='different grids'):
+                inverse_tables.InverseTables(str(grid_copy/'tables'), grids)
+        else:
+            assert grids.checksum()==exact
+            inverse_tables.InverseTables(str(grid_copy/'tables'), grids)
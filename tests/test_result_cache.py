@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import neid_calculator.result_cache as result_cache
+
+
+class Recorder(object):
+    """
+    a cacheable function that counts its calls
+    """
+
+    __module__ = __name__
+    __name__ = 'recorder'
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return sum(args)+sum(kwargs.values())
+
+
+@pytest.mark.parametrize('value', [np.float16(1.2345678), np.float32(1.2345678), np.float64(1.2345678),
+                                   np.longdouble(1.2345678), 1.2345678])
+def test_floats_are_quantized(value):
+    quantized = result_cache._quantize(value, 3)
+    assert type(quantized) is float and quantized==1.23
+
+
+def test_other_values_are_kept():
+    class float64(object):
+        pass
+
+    unrelated = float64()
+    for value in (unrelated, 12345678, np.int64(12345678), 'nan', None):
+        assert result_cache._quantize(value, 3) is value
+
+
+def test_hits_misses_and_lru_eviction():
+    func = Recorder()
+    cache = result_cache.ResultCache(maxsize=3, digits=4)
+    for x in (1., 2., 3.):
+        cache.call(func, x)
+    # equal after rounding to 4 digits, and refreshes 1. as the most recently used
+    assert cache.call(func, 1.00001)==1.
+    cache.call(func, 4.)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size'])==(1, 4, 1, 3)
+    assert stats['hit_rate']==pytest.approx(0.2)
+
+    calls = len(func.calls)
+    cache.call(func, 1.)
+    cache.call(func, 3.)
+    assert len(func.calls)==calls
+    # 2. was the least recently used
+    cache.call(func, 2.)
+    assert len(func.calls)==calls+1 and cache.stats()['evictions']==2
+
+
+def test_arguments_are_part_of_the_key():
+    func = Recorder()
+    cache = result_cache.ResultCache()
+    assert cache.call(func, 1., 2.)==cache.call(func, 1., b=2.)==3.
+    assert cache.call(func, 2., 1.)==3.
+    assert len(func.calls)==3
+
+
+def test_shared_store(tmp_path):
+    func = Recorder()
+    path = str(tmp_path/'cache.sqlite')
+    result_cache.ResultCache(path=path).call(func, 5.)
+    other = result_cache.ResultCache(path=path)
+    assert other.call(func, 5.)==5. and len(func.calls)==1
+    assert other.stats()['hits']==1 and other.stats()['shared_size']==1
+
+
+def test_changed_grids_drop_cached_results(grid_copy):
+    from astropy.io import fits
+
+    func = Recorder()
+    cache = result_cache.ResultCache(check_interval=0)
+    cache.call(func, 1.)
+    cache.call(func, 1.)
+    assert len(func.calls)==1
+    with fits.open(str(grid_copy/'dv_uncertainty_master.fits'), mode='update') as hdul:
+        hdul[0].data *= 2
+    with pytest.warns(UserWarning, match='stale'):
+        cache.call(func, 1.)
+    assert len(func.calls)==2 and cache.stats()['size']==1
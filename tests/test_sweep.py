@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import neid_calculator.neid_etcalc_public as etc
+import neid_calculator.sweep as sweep
+
+
+MAGNITUDES = np.linspace(2, 18, 81)
+TEMPERATURES = np.linspace(2600, 6700, 83)
+EXPTIMES = np.geomspace(5, 4000, 77)
+
+# (teff, vmag) sweeps, each running off the grid at both ends
+SWEEPS = [(5000., MAGNITUDES), (TEMPERATURES, 9.), (TEMPERATURES[:, np.newaxis], MAGNITUDES)]
+
+
+def _assert_same(curve, expected):
+    np.testing.assert_array_equal(np.isnan(curve), np.isnan(expected))
+    np.testing.assert_allclose(curve, expected, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize('teff, vmag', SWEEPS)
+def test_values_match_calculator(teff, vmag):
+    _assert_same(sweep.SNR(teff, vmag, 300., 573.6), etc.NEID_SNR(teff, vmag, 300., 573.6))
+    _assert_same(sweep.RV_prec(teff, vmag, 300.), etc.NEID_RV_prec(teff, vmag, 300.))
+    _assert_same(sweep.RV_prec(teff, vmag, 300., use_order=True, order=120),
+                 etc.NEID_RV_prec(teff, vmag, 300., use_order=True, order=120))
+
+
+def test_exptime_sweep_matches_calculator():
+    _assert_same(sweep.SNR(5000., 9., EXPTIMES, 573.6), etc.NEID_SNR(5000., 9., EXPTIMES, 573.6))
+    _assert_same(sweep.RV_prec(5000., 9., EXPTIMES), etc.NEID_RV_prec(5000., 9., EXPTIMES))
+
+
+@pytest.mark.parametrize('teff, vmag', SWEEPS)
+@pytest.mark.parametrize('quantize', [False, True])
+def test_exptimes_match_calculator(teff, vmag, quantize):
+    # the second goal reuses the cached node curves of the first
+    for snr, rv_precision in ((100., 1.), (30., 0.5)):
+        _assert_same(sweep.exptime_SNR(teff, vmag, snr, 573.6, quantize=quantize),
+                     etc.NEID_exptime_SNR(teff, vmag, snr, 573.6, quantize=quantize))
+        _assert_same(sweep.exptime_RV(teff, vmag, rv_precision, quantize=quantize),
+                     etc.NEID_exptime_RV(teff, vmag, rv_precision, quantize=quantize))
+    _assert_same(sweep.exptime_RV(teff, vmag, 2., use_order=True, order=120, quantize=quantize),
+                 etc.NEID_exptime_RV(teff, vmag, 2., use_order=True, order=120, quantize=quantize))
+
+
+def test_goal_sweep_matches_calculator():
+    goals = np.geomspace(1, 1000, 50)
+    _assert_same(sweep.exptime_SNR(5000., 9., goals, 573.6), etc.NEID_exptime_SNR(5000., 9., goals, 573.6))
+    goals = np.geomspace(0.1, 30, 50)
+    _assert_same(sweep.exptime_RV(5000., 9., goals), etc.NEID_exptime_RV(5000., 9., goals))
+
+
+def test_unmatched_wavelength_raises():
+    with pytest.raises(IndexError):
+        sweep.SNR(5000., MAGNITUDES, 300., 573.0)
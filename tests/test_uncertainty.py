@@ -0,0 +1,75 @@
+import numpy as np
+
+import neid_calculator.neid_etcalc_public as etc
+import neid_calculator.uncertainty as uncertainty
+
+
+TEFF = np.array([5500., 4000., 6200.])
+VMAG = np.array([8., 11., 14.])
+TEFF_ERR = np.array([100., 50., 150.])
+VMAG_ERR = np.array([0.1, 0.2, 0.05])
+
+
+def test_percentiles_match_nanpercentile():
+    samples = np.random.default_rng(0).random((4, 101))
+    samples[1, ::3] = np.nan
+    samples[2] = np.nan
+    expected = np.nanpercentile(samples[[0, 1, 3]], uncertainty.PERCENTILES, axis=-1).T
+    result = uncertainty.percentiles(samples)
+    np.testing.assert_allclose(result[[0, 1, 3]], expected, rtol=1e-14)
+    assert np.all(np.isnan(result[2]))
+
+
+def test_percentiles_with_infinite_samples():
+    # saturated or unreachable draws count as infinite exposure times
+    samples = np.array([[1., 2., np.inf, np.nan], [np.inf, np.inf, np.inf, 3.]])
+    result = uncertainty.percentiles(samples, q=(0., 25., 50., 75., 100.))
+    np.testing.assert_array_equal(result, [[1., 1.5, 2., np.inf, np.inf],
+                                           [3., np.inf, np.inf, np.inf, np.inf]])
+
+
+def test_unreached_draws_give_infinite_upper_percentiles():
+    result = uncertainty.propagate([5500.], [10.8859], [1.], [0.2], rv_precision=1., n_samples=101, seed=19)
+    exptime = result['exptime_rv'][0]
+    assert np.all(np.isfinite(exptime[:3])) and np.all(np.isinf(exptime[3:]))
+    assert np.all(np.diff(exptime[:3])>0)
+
+
+def test_propagate_matches_direct_calls():
+    n_samples = 500
+    teff_s, vmag_s = uncertainty.sample_targets(np.random.default_rng(3), TEFF, VMAG, TEFF_ERR, VMAG_ERR,
+                                                np.full(3, 0.5), n_samples)
+    result = uncertainty.propagate(TEFF, VMAG, TEFF_ERR, VMAG_ERR, correlation=0.5, exptime=300., snr=50.,
+                                   rv_precision=2., n_samples=n_samples, seed=3)
+
+    def expected(values):
+        return np.nanpercentile(values, uncertainty.PERCENTILES, axis=-1).T
+
+    np.testing.assert_allclose(result['rv_precision'], expected(etc.NEID_RV_prec(teff_s, vmag_s, 300.)),
+                               rtol=1e-12)
+    np.testing.assert_allclose(result['snr'], expected(etc.NEID_SNR(teff_s, vmag_s, 300., 552.97)),
+                               rtol=1e-12)
+    in_bounds = etc.NEID_RV_prec(teff_s, vmag_s, 300., return_mask=True)[1]
+    np.testing.assert_allclose(result['in_bounds'], in_bounds.mean(axis=1))
+    for name, values in (('exptime_snr', etc.NEID_exptime_SNR(teff_s, vmag_s, 50., 552.97)),
+                         ('exptime_rv', etc.NEID_exptime_RV(teff_s, vmag_s, 2.))):
+        values[in_bounds & np.isnan(values)] = np.inf
+        # np.nanpercentile gives NaN next to inf samples
+        np.testing.assert_allclose(result[name], uncertainty.percentiles(values), rtol=1e-12)
+    assert np.all(np.isinf(result['exptime_rv'][2]))
+
+
+def test_propagate_does_not_depend_on_chunk():
+    kwargs = dict(exptime=300., rv_precision=1., n_samples=200, seed=[1, 2])
+    whole = uncertainty.propagate(TEFF, VMAG, TEFF_ERR, VMAG_ERR, **kwargs)
+    split = uncertainty.propagate(TEFF, VMAG, TEFF_ERR, VMAG_ERR, chunk=200, **kwargs)
+    for name in whole:
+        np.testing.assert_array_equal(whole[name], split[name])
+
+
+def test_unmatched_wavelength_gives_nan_snr():
+    result = uncertainty.propagate(TEFF[:2], VMAG[:2], TEFF_ERR[:2], VMAG_ERR[:2], exptime=300., snr=50.,
+                                   wavelength=[552.97, 553.5], n_samples=50)
+    assert np.all(np.isfinite(result['snr'][0])) and np.all(np.isnan(result['snr'][1]))
+    assert np.all(np.isnan(result['exptime_snr'][1]))
+    assert np.all(np.isfinite(result['rv_precision']))
@@ -0,0 +1,145 @@
+import numpy as np
+
+import neid_calculator.grid_store as grid_store
+import neid_calculator.neid_etcalc_public as etc
+
+
+"""
+Monte Carlo propagation of teff and vmag uncertainties
+
+propagate() draws n_samples (teff, vmag) pairs per target from a normal
+distribution with the given means, sigmas and teff/vmag correlation, evaluates
+the vectorized calculator functions on all samples of a batch of targets at
+once, and returns percentiles of the RV precision, SNR and exposure times.
+
+    import neid_calculator.uncertainty as uncertainty
+    result = uncertainty.propagate(teff, vmag, teff_err, vmag_err, exptime=300.,
+                                   rv_precision=1., n_samples=10000)
+    result['exptime_rv']        # (n_targets, len(PERCENTILES))
+
+the samples are drawn in order from one seeded generator, so the result does
+not depend on the chunk size. at most about `chunk` samples are held at a time
+(but always all samples of one target, since percentiles need them). samples
+that fall outside the grids are dropped, and the fraction kept is returned as
+'in_bounds'. exposure times that are not reached within 3600 s count as
+infinite, so an upper percentile can be inf. for whole catalogues use
+python -m neid_calculator.catalog --samples N, which runs batches in parallel.
+"""
+
+PERCENTILES = (2.5, 16., 50., 84., 97.5)
+
+
+def sample_targets(rng, teff, vmag, teff_err, vmag_err, correlation, n_samples):
+    """
+    draw correlated normal (teff, vmag) samples; returns two arrays of shape
+    (n_targets, n_samples)
+    """
+    z = rng.standard_normal((len(teff), n_samples, 2))
+    correlation = np.asarray(correlation, dtype=np.double)[..., np.newaxis]
+    teff_samples = teff[:, np.newaxis]+teff_err[:, np.newaxis]*z[..., 0]
+    vmag_samples = vmag[:, np.newaxis]+vmag_err[:, np.newaxis]*(correlation*z[..., 0]+
+                                                                np.sqrt(1-correlation**2)*z[..., 1])
+    return teff_samples, vmag_samples
+
+
+def percentiles(samples, q=PERCENTILES):
+    """
+    percentiles along the last axis, ignoring NaN (linear interpolation, as
+    np.nanpercentile, but vectorized over rows); NaN where a row has no values.
+    a percentile that lands on a sample is that sample, and one between a
+    finite sample and inf is inf
+    """
+    ordered = np.sort(samples, axis=-1)
+    valid = np.count_nonzero(~np.isnan(samples), axis=-1)[..., np.newaxis]
+    position = np.asarray(q, dtype=np.double)/100*np.maximum(valid-1, 0)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower+1, np.maximum(valid-1, 0))
+    frac = position-lower
+    low = np.take_along_axis(ordered, lower, axis=-1)
+    high = np.take_along_axis(ordered, upper, axis=-1)
+    with np.errstate(invalid='ignore'):
+        result = np.where((frac==0) | (high==low), low, low+(high-low)*frac)
+    return np.where(valid>0, result, np.nan)
+
+
+def _columns(n, value):
+    return np.broadcast_to(np.asarray(value, dtype=np.double), (n,))
+
+
+def propagate(teff, vmag, teff_err, vmag_err, correlation=0., exptime=None, snr=None,
+              rv_precision=None, wavelength=552.97, n_samples=10000, q=PERCENTILES, seed=0,
+              chunk=1000000, quantize=False):
+    """
+    percentiles of the calculator outputs under teff and vmag uncertainties
+    teff, vmag:            means (K, V mag), one per target
+    teff_err, vmag_err:    standard deviations
+    correlation:           correlation coefficient of the teff and vmag errors
+    exptime:               exposure time (s) for the RV precision and SNR
+    snr:                   SNR goal for the exposure time
+    rv_precision:          RV precision goal (m/s) for the exposure time
+    wavelength:            wavelength (nm) of the SNR; targets whose wavelength is
+                           not an order center get NaN SNR percentiles
+    n_samples:             samples per target
+    q:                     percentiles (0-100)
+    seed:                  seed of the random generator (int or sequence of ints)
+    chunk:                 samples evaluated at a time
+
+    returns a dict with 'in_bounds', the fraction of samples inside the grids
+    per target, and an (n_targets, len(q)) array of percentiles for each of
+    'rv_precision' and 'snr' (when exptime is given), 'exptime_snr' (when snr is
+    given) and 'exptime_rv' (when rv_precision is given). all inputs broadcast
+    against each other
+    """
+    teff, vmag = [np.atleast_1d(np.asarray(a, dtype=np.double)) for a in np.broadcast_arrays(teff, vmag)]
+    n = len(teff)
+    teff_err, vmag_err, correlation = [_columns(n, a) for a in (teff_err, vmag_err, correlation)]
+    wavelength = _columns(n, wavelength)
+    grids = grid_store.get_store()
+    matched = etc.NEID_order_match(wavelength)[1]
+    wavelength = np.where(matched, wavelength, grids.wavelength_grid[0])
+
+    goals = {}
+    if exptime is not None:
+        goals['rv_precision'] = goals['snr'] = _columns(n, exptime)
+    if snr is not None:
+        goals['exptime_snr'] = _columns(n, snr)
+    if rv_precision is not None:
+        goals['exptime_rv'] = _columns(n, rv_precision)
+
+    result = {'in_bounds': np.empty(n)}
+    for name in goals:
+        result[name] = np.empty((n, len(q)))
+
+    rng = np.random.default_rng(seed)
+    step = max(1, chunk//n_samples)
+    for start in range(0, n, step):
+        part = slice(start, min(start+step, n))
+        teff_s, vmag_s = sample_targets(rng, teff[part], vmag[part], teff_err[part], vmag_err[part],
+                                        correlation[part], n_samples)
+        shape = teff_s.shape
+        teff_s, vmag_s = teff_s.ravel(), vmag_s.ravel()
+
+        def repeat(values):
+            return np.repeat(values[part], n_samples)
+
+        in_bounds = etc._in_bounds(grids, teff_s, vmag_s).reshape(shape)
+        result['in_bounds'][part] = in_bounds.mean(axis=1)
+        for name, goal in goals.items():
+            if name=='rv_precision':
+                values = etc.NEID_RV_prec(teff_s, vmag_s, repeat(goal))
+            elif name=='snr':
+                values = etc.NEID_SNR(teff_s, vmag_s, repeat(goal), repeat(wavelength))
+            elif name=='exptime_snr':
+                values = etc.NEID_exptime_SNR(teff_s, vmag_s, repeat(goal), repeat(wavelength),
+                                              quantize=quantize)
+            else:
+                values = etc.NEID_exptime_RV(teff_s, vmag_s, repeat(goal), quantize=quantize)
+            values = values.reshape(shape)
+            if name.startswith('exptime'):
+                # in the grids but not reached within 3600 s
+                values[in_bounds & np.isnan(values) & np.isfinite(goal[part, np.newaxis])] = np.inf
+            result[name][part] = percentiles(values, q)
+        for name in ('snr', 'exptime_snr'):
+            if name in result:
+                result[name][part][~matched[part]] = np.nan
+    return result